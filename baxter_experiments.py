@@ -1,112 +1,240 @@
 #!/usr/bin/env python
 
+import sys
 import time
+import functools
+import importlib
+import multiprocessing
 import copct
 
+@functools.lru_cache(maxsize=None)
+def _state_dict(state):
+    """
+    Dict view of a (hashable) tuple-of-pairs state, built once per distinct state.
+    The returned dict is shared between calls and must not be modified.
+    """
+    return dict(state)
+
 M = 3
+
+# Destination ids that are grippers, and that are cleared out of the workspace
+arm_ids = ("left","right")
+clear_ids = ("discard-bin")
+# Assembly types that cannot be moved as unobstructed objects
+dock_types = frozenset(("DockCase","DockDrawer"))
+
+"""
+Handlers for each rule in the causal relation.
+Each handler takes v and returns a list of all possible causes of v under that rule.
+Rules are mutually exclusive, so the lists never contain duplicates.
+"""
+
+def _move_arm_and_grasp(v):
+    g = []
+    arm, object_id = v[0][2]
+    dest_id = arm_ids[int(arm)-1]
+    asm_type = _state_dict(v[0][0])[object_id]
+    if asm_type not in dock_types:
+        g.append((v[0][0], "move unobstructed object",(object_id, dest_id, (), ())))
+    return g
+
+def _put_down_grasped_object(v):
+    arm, dest_id, dM, dt = v[0][2]
+    object_id = _state_dict(v[0][0])["gripping"][int(arm)-1]
+    return [(v[0][0], "move unobstructed object", (object_id, dest_id, dM, dt))]
+
+def _move_unobstructed_object(v):
+    g = []
+    object_id, dest_id, dM, dt = v[0][2]
+    if dest_id in arm_ids:
+        g.append((v[0][0], "move object", v[0][2]))
+    else:
+        asm_type = _state_dict(v[0][0])[dest_id]
+        if (asm_type=="DockCase") or (dest_id in clear_ids):
+            g.append((v[0][0],"move unobstructed object to free spot", (object_id, dest_id)))
+        g.append((v[0][0],"move object", v[0][2]))
+    return g
+
+def _move_object(v):
+    g = []
+    object_id, dest_id, dM, dt = v[0][2]
+    if dest_id not in arm_ids:
+        if (dest_id=="dock-case_6") or (dest_id in clear_ids):
+            g.append((v[0][0],"move object to free spot", (object_id, dest_id)))
+    return g
+
+def _move_object_to_free_spot(v):
+    g = []
+    object_id, dest_id = v[0][2]
+    if dest_id=="discard-bin":
+        g.append((v[0][0],"discard object",(object_id,)))
+    return g
+
+def _move_grasped_object_release(v):
+    g = []
+    arm, dest_id, dM, dt = v[0][2]
+    object_id = _state_dict(v[0][0])["gripping"][int(arm)-1]
+    asm_type = _state_dict(v[0][0])[object_id]
+    if asm_type not in dock_types:
+        g.append((v[0][0], "put down grasped object", v[0][2]))
+    return g
+
+def _grasp_put_down(v):
+    g = []
+    arm_0, object_id = v[0][2]
+    arm_1, dest_id, dM, dt = v[1][2]
+    asm_type = _state_dict(v[0][0])[object_id]
+    if (arm_0==arm_1) and not (asm_type=="DockDrawer"):
+        g.append((v[0][0],"move unobstructed object",(object_id, dest_id, dM, dt)))
+    return g
+
+def _screw_valve_twice(v):
+    g = []
+    (arm_0, rotations_0), (arm_1, rotations_1) = v[0][2], v[1][2]
+    if arm_0==arm_1:
+        g.append((v[0][0],"screw valve",(arm_0,rotations_0+rotations_1)))
+    return g
+
+def _screw_remove_screw(v):
+    return [(v[0][0],"remove screw from valve",())]
+
+def _grasp_remove_screw(v):
+    g = []
+    object_id = v[0][2][1]
+    asm_type = _state_dict(v[0][0])[object_id]
+    if asm_type == 'valve_screw':
+        g.append((v[0][0],"grasp and remove screw from valve",(object_id,)))
+    return g
+
+def _insert_screw_release(v):
+    num_rotations = 0
+    rotation_level = 4 - num_rotations # 4 = initial inserted, unscrewed
+    return [(v[0][0],"insert and screw valve",(rotation_level,))]
+
+def _grasp_move_release(v):
+    g = []
+    arm_0, object_id = v[0][2]
+    arm_1, _, _, dt = v[1][2]
+    arm_2, = v[2][2]
+    asm_type = _state_dict(v[0][0])[object_id]
+    if (arm_0==arm_1) and (arm_1==arm_2) and (asm_type=="DockDrawer"):
+        # compare squared distance against the (squared) unit threshold, no sqrt needed
+        sq_distance = 0.0
+        for (x,) in dt: sq_distance += x*x
+        if sq_distance > 1.0:
+            g.append((v[0][0],"open dock drawer",(object_id, v[2][0])))
+        else:
+            g.append((v[0][0],"close dock drawer",(object_id,)))
+    return g
+
+def _grasp_ball_release(v):
+    g = []
+    arm_0, object_id = v[0][2]
+    arm_2, = v[2][2]
+    asm_type = _state_dict(v[0][0])[object_id]
+    if (arm_0==arm_2) and (asm_type=="ball_swivel"):
+        g.append((v[0][0],v[1][1],()))
+    return g
+
+def _insert_screw_screw_release(v):
+    num_rotations = v[1][2][1]
+    rotation_level = 4 - num_rotations # 4 = initial inserted, unscrewed
+    return [(v[0][0],"insert and screw valve",(rotation_level,))]
+
+def _grasp_screw_release(v):
+    g = []
+    arm_0, arm_1, arm_2 = v[0][2][0], v[1][2][0], v[2][2][0]
+    if arm_0 == arm_1 and arm_1 == arm_2:
+        screw_id = v[0][2][1]
+        num_rotations = v[1][2][1]
+        rotation_level = 4 - num_rotations # 4 = initial inserted, unscrewed
+        g.append((v[0][0],"grasp and screw valve",(screw_id, rotation_level,)))
+    return g
+
+"""
+Dispatch table from (len(v), task names in v) to the handler for the matching rule.
+"""
+_CAUSES = {
+    (1, ("move arm and grasp",)): _move_arm_and_grasp,
+    (1, ("put down grasped object",)): _put_down_grasped_object,
+    (1, ("move unobstructed object",)): _move_unobstructed_object,
+    (1, ("move object",)): _move_object,
+    (1, ("move object to free spot",)): _move_object_to_free_spot,
+    (2, ("move grasped object","release")): _move_grasped_object_release,
+    (2, ("move arm and grasp","put down grasped object")): _grasp_put_down,
+    (2, ("screw valve","screw valve")): _screw_valve_twice,
+    (2, ("screw valve","remove screw from valve")): _screw_remove_screw,
+    (2, ("move arm and grasp","remove screw from valve")): _grasp_remove_screw,
+    (2, ("insert screw in valve","release")): _insert_screw_release,
+    (3, ("move arm and grasp","move grasped object","release")): _grasp_move_release,
+    (3, ("move arm and grasp","close ball","release")): _grasp_ball_release,
+    (3, ("move arm and grasp","open ball","release")): _grasp_ball_release,
+    (3, ("insert screw in valve","screw valve","release")): _insert_screw_screw_release,
+    (3, ("move arm and grasp","screw valve","release")): _grasp_screw_release,
+}
+# intern task names so that lookups on interned demo task names compare by identity
+_CAUSES = {(n, tuple(map(sys.intern, tasks))): handler for ((n, tasks), handler) in _CAUSES.items()}
+
+def intern_tasks(seq):
+    """
+    Intern the task name of every (state, task name, parameter values) element in a sequence.
+    Dispatch on interned names then compares strings by identity instead of by content.
+    """
+    return tuple((state, sys.intern(name), args) for (state, name, args) in seq)
+
+@functools.lru_cache(maxsize=200000)
 def causes(v):
     """
     Causal relation for the robotic imitation learning domain.
     v is a sequence of intentions or actions.
     Each element v[i] is of the form (state, task name, parameter values).
-    Returns the set of all possible causes of v.
+    Returns a tuple of all possible causes of v.
+    Results are memoized on v, since copct.explain revisits the same sub-sequences many times.
     """
-    g = set() # set of possible causes
-    arm_ids = ("left","right")
-    clear_ids = ("discard-bin")
-    states, tasks, args = zip(*v)
-    if len(v) == 1:
-        if tasks == ("move arm and grasp",):
-            arm, object_id = args[0]
-            dest_id = arm_ids[int(arm)-1]
-            asm_type = dict(states[0])[object_id]
-            if asm_type not in ("DockCase","DockDrawer"):
-                g.add((states[0], "move unobstructed object",(object_id, dest_id, (), ())))
-        if tasks == ("put down grasped object",):
-            arm, dest_id, dM, dt = args[0]
-            object_id = dict(states[0])["gripping"][int(arm)-1]
-            g.add((states[0], "move unobstructed object", (object_id, dest_id, dM, dt)))
-        if tasks == ("move unobstructed object",):
-            object_id, dest_id, dM, dt = args[0]
-            if dest_id in arm_ids:
-                g.add((states[0], "move object", args[0]))
-            else:
-                asm_type = dict(states[0])[dest_id]
-                if (asm_type=="DockCase") or (dest_id in clear_ids):
-                    g.add((states[0],"move unobstructed object to free spot", (object_id, dest_id)))
-                g.add((states[0],"move object", args[0]))
-        if tasks == ("move object",):
-            object_id, dest_id, dM, dt = args[0]
-            if dest_id not in arm_ids:
-                if (dest_id=="dock-case_6") or (dest_id in clear_ids):
-                    g.add((states[0],"move object to free spot", (object_id, dest_id)))
-        if tasks == ("move object to free spot",):
-            object_id, dest_id = args[0]
-            if dest_id=="discard-bin":
-                g.add((states[0],"discard object",(object_id,)))
-    if len(v)==2:
-        if tasks == ("move grasped object","release"):
-            arm, dest_id, dM, dt = args[0]
-            object_id = dict(states[0])["gripping"][int(arm)-1]
-            asm_type = dict(states[0])[object_id]
-            if asm_type not in ("DockCase","DockDrawer"):
-                g.add((states[0], "put down grasped object", args[0]))
-        if tasks == ("move arm and grasp","put down grasped object"):
-            arm_0, object_id = args[0]
-            arm_1, dest_id, dM, dt = args[1]
-            asm_type = dict(states[0])[object_id]
-            if (arm_0==arm_1) and not (asm_type=="DockDrawer"):
-                g.add((states[0],"move unobstructed object",(object_id, dest_id, dM, dt)))
-        if tasks == ("screw valve","screw valve"):
-            arms, rotations = zip(*args)
-            if arms[0]==arms[1]:
-                g.add((states[0],"screw valve",(arms[0],sum(rotations))))
-        if tasks == ("screw valve","remove screw from valve"):
-            g.add((states[0],"remove screw from valve",()))
-        if tasks == ("move arm and grasp","remove screw from valve"):
-            object_id = args[0][1]
-            asm_type = dict(states[0])[object_id]
-            if asm_type == 'valve_screw':
-                g.add((states[0],"grasp and remove screw from valve",(object_id,)))
-        if tasks == ("insert screw in valve","release"):
-            num_rotations = 0
-            rotation_level = 4 - num_rotations # 4 = initial inserted, unscrewed
-            g.add((states[0],"insert and screw valve",(rotation_level,)))
-        if tasks == ("move arm and grasp","remove screw from valve"):
-            object_id = args[0][1]
-            asm_type = dict(states[0])[object_id]
-            if asm_type == 'valve_screw':
-                g.add((states[0],"grasp and remove screw from valve",(object_id,)))
-    if len(v)==3:
-        if tasks == ("move arm and grasp","move grasped object","release"):
-            arm_0, object_id = args[0]
-            arm_1, _, _, dt = args[1]
-            arm_2, = args[2]
-            asm_type = dict(states[0])[object_id]
-            if (arm_0==arm_1) and (arm_1==arm_2) and (asm_type=="DockDrawer"):
-                distance = sum([x**2 for (x,) in dt])**0.5
-                if distance > 1:
-                    g.add((states[0],"open dock drawer",(object_id, states[2])))
-                else:
-                    g.add((states[0],"close dock drawer",(object_id,)))
-        if tasks in [("move arm and grasp","close ball","release"),("move arm and grasp","open ball","release")]:
-            arm_0, object_id = args[0]
-            arm_2, = args[2]
-            asm_type = dict(states[0])[object_id]
-            if (arm_0==arm_2) and (asm_type=="ball_swivel"):
-                g.add((states[0],tasks[1],()))
-        if tasks == ("insert screw in valve","screw valve","release"):
-            num_rotations = args[1][1]
-            rotation_level = 4 - num_rotations # 4 = initial inserted, unscrewed
-            g.add((states[0],"insert and screw valve",(rotation_level,)))
-        if tasks == ("move arm and grasp","screw valve","release"):
-            arm_0, arm_1, arm_2 = args[0][0], args[1][0], args[2][0]
-            if arm_0 == arm_1 and arm_1 == arm_2:
-                screw_id = args[0][1]
-                num_rotations = args[1][1]
-                rotation_level = 4 - num_rotations # 4 = initial inserted, unscrewed
-                g.add((states[0],"grasp and screw valve",(screw_id, rotation_level,)))
-    return g
+    # avoid building a tuple of task names for the common singleton case
+    if len(v) == 1: tasks = (v[0][1],)
+    else: tasks = tuple([t for (_,t,_) in v])
+    handler = _CAUSES.get((len(v), tasks))
+    if handler is None: return ()
+    return tuple(handler(v))
+
+def _process_demo(demo_name, check_irr=True):
+    """
+    Cover one demo and prune its covers by each parsimony criterion.
+    Defined at module level so that it can be dispatched to worker processes.
+    Inputs:
+        demo_name: name of the demo module in baxter_corpus
+        check_irr: if True, apply the irredundancy criterion
+    Outputs:
+        N: the length of the demo
+        result: dictionary of covers and outcomes for the demo
+    """
+    print(demo_name)
+    # import demo and ground truth
+    demo = intern_tasks(importlib.import_module("baxter_corpus.%s"%demo_name).demo)
+    ground_truth = intern_tasks(importlib.import_module("baxter_corpus.%s_ground_truth"%demo_name).ground_truth)
+    # Cover and prune by each parsimony criterion
+    result = {}
+    start_time = time.perf_counter()
+    status, tlcovs, g = copct.explain(causes, demo, M=M)
+    result["run_time"] = time.perf_counter()-start_time
+    result["tlcovs"], result["g"] = tlcovs, g
+    pruned = copct.multiCriteriaTLCovers(tlcovs)
+    for crit in ["_mc", "_md", "_xd", "_mp", "_fsn", "_fsx"]:
+        result["tlcovs%s"%crit] = [u for (u,_,_,_,_) in pruned[crit[1:]][0]]
+    start_time = time.perf_counter()
+    if check_irr:
+        status, tlcovs_irr = copct.irredundantTLCovers(tlcovs, timeout=1000)
+        if status == False: print("IRR timeout")
+    else:
+        tlcovs_irr = tlcovs
+    result["run_time_irr"] = time.perf_counter()-start_time
+    result["tlcovs_irr"] = [u for (u,_,_,_,_) in tlcovs_irr]
+    # scan lazily for the ground truth, stopping at the first match rather than building a list of covers
+    result["u in tlcovs"] = any(u == ground_truth for (u,_,_,_,_) in tlcovs)
+    for crit in ["_mc", "_md", "_xd", "_mp", "_fsn", "_fsx", "_irr"]:
+        result["u in tlcovs%s"%crit] = ground_truth in result["tlcovs%s"%crit]
+    return len(demo), result
 
 def run_experiments(check_irr=True):
     results = {}
@@ -115,45 +243,13 @@ def run_experiments(check_irr=True):
     demos = ["demo_%s_%d"%(skill, di) for skill in ["remove_red_drive","replace_red_with_green","replace_red_with_spare","swap_red_with_green"] for di in [1,2]]
     # Block stacking demos
     demos += ["demo_il", "demo_ai", "demo_um"]
-    # Cover demos
+    # Cover demos (independently, in parallel worker processes)
     print("Covering demos...")
     Ns = {}
-    for demo_name in demos:
-        print(demo_name)
-        # import demo and ground truth
-        exec_str = "from baxter_corpus.%s import demo"%demo_name
-        exec(exec_str, globals())
-        exec_str = "from baxter_corpus.%s_ground_truth import ground_truth"%demo_name
-        exec(exec_str, globals())
-        # Cover and prune by each parsimony criterion
-        Ns[demo_name] = len(demo)
-        results[demo_name] = {}
-        start_time = time.clock()
-        status, tlcovs, g = copct.explain(causes, demo, M=M)
-        results[demo_name]["run_time"] = time.clock()-start_time
-        results[demo_name]["tlcovs"], results[demo_name]["g"] = tlcovs, g
-        results[demo_name]["tlcovs_mc"] = [u for (u,_,_,_,_) in copct.minCardinalityTLCovers(tlcovs)[0]]
-        results[demo_name]["tlcovs_md"] = [u for (u,_,_,_,_) in copct.maxDepthTLCovers(tlcovs)[0]]
-        results[demo_name]["tlcovs_xd"] = [u for (u,_,_,_,_) in copct.minimaxDepthTLCovers(tlcovs)[0]]
-        results[demo_name]["tlcovs_mp"] = [u for (u,_,_,_,_) in copct.minParametersTLCovers(tlcovs)[0]]
-        results[demo_name]["tlcovs_fsn"] = [u for (u,_,_,_,_) in copct.minForestSizeTLCovers(tlcovs)[0]]
-        results[demo_name]["tlcovs_fsx"] = [u for (u,_,_,_,_) in copct.maxForestSizeTLCovers(tlcovs)[0]]
-        start_time = time.clock()
-        if check_irr:
-            status, tlcovs_irr = copct.irredundantTLCovers(tlcovs, timeout=1000)
-            if status == False: print("IRR timeout")
-        else:
-            tlcovs_irr = tlcovs
-        results[demo_name]["run_time_irr"] = time.clock()-start_time
-        results[demo_name]["tlcovs_irr"] = [u for (u,_,_,_,_) in tlcovs_irr]
-        results[demo_name]["u in tlcovs"] = ground_truth in [u for (u,_,_,_,_) in tlcovs]
-        results[demo_name]["u in tlcovs_mc"] = ground_truth in results[demo_name]["tlcovs_mc"]
-        results[demo_name]["u in tlcovs_md"] = ground_truth in results[demo_name]["tlcovs_md"]
-        results[demo_name]["u in tlcovs_xd"] = ground_truth in results[demo_name]["tlcovs_xd"]
-        results[demo_name]["u in tlcovs_mp"] = ground_truth in results[demo_name]["tlcovs_mp"]
-        results[demo_name]["u in tlcovs_fsn"] = ground_truth in results[demo_name]["tlcovs_fsn"]
-        results[demo_name]["u in tlcovs_fsx"] = ground_truth in results[demo_name]["tlcovs_fsx"]
-        results[demo_name]["u in tlcovs_irr"] = ground_truth in results[demo_name]["tlcovs_irr"]
+    with multiprocessing.Pool() as pool:
+        for demo_name, (N, result) in zip(demos, pool.map(functools.partial(_process_demo, check_irr=check_irr), demos)):
+            Ns[demo_name] = N
+            results[demo_name] = result
     # display results
     criteria = ["", "_mc", "_irr", "_md", "_xd", "_mp", "_fsn", "_fsx"]
     print("Accuracy:")
@@ -176,5 +272,5 @@ def run_experiments(check_irr=True):
 
 if __name__ == "__main__":
 
-    check_irr = raw_input("Run irredundancy checks?  May take several minutes. [y/n]")
+    check_irr = input("Run irredundancy checks?  May take several minutes. [y/n]")
     results = run_experiments(check_irr == "y")
@@ -187,17 +187,19 @@ def irredundantTLCovers(tlcovs, timeout=300):
     """
     tlcovs_irr = []
     start = time.process_time()
+    # A different cover can only be a sub-sequence of u if it is strictly shorter than u.
+    # So each distinct u is checked once, against the distinct covers in order of increasing length,
+    # and covers of minimum cardinality are irredundant without any checks.
+    others = sorted(set(u for (u,_,_,_,_) in tlcovs), key=len)
+    u_is_irr = {}
     for (u,k,d_min,d_max,ts) in tlcovs:
-        u_is_irr = True # until proven otherwise
-        for (other_u,_,_,_,_) in tlcovs:
-            if time.process_time()-start > timeout:
-                return False, tlcovs_irr
-            # skip u1
-            if u==other_u: continue
-            # check if other_u is a sub-sequence of u
-            if len(other_u) > len(u):
-                is_sub_seq = False
-            else:
+        if u not in u_is_irr:
+            u_is_irr[u] = True # until proven otherwise
+            for other_u in others:
+                if time.process_time()-start > timeout:
+                    return False, tlcovs_irr
+                if len(other_u) >= len(u): break
+                # check if other_u is a sub-sequence of u
                 is_sub_seq = True # until proven otherwise
                 u_tail = u
                 for other_u_i in other_u:
@@ -206,11 +208,11 @@ def irredundantTLCovers(tlcovs, timeout=300):
                     else:
                         is_sub_seq = False
                         break
-            # other_u is a sub-sequence of u, u is redundant
-            if is_sub_seq:
-                u_is_irr = False
-                break
-        if u_is_irr:
+                # other_u is a sub-sequence of u, u is redundant
+                if is_sub_seq:
+                    u_is_irr[u] = False
+                    break
+        if u_is_irr[u]:
             tlcovs_irr.append((u,k,d_min,d_max,ts))
     return True, tlcovs_irr
 
@@ -222,6 +224,55 @@ def minParametersTLCovers(tlcovs):
     tlcovs_mp = [(u,k,d_min,d_max,ts) for (u,k,d_min,d_max,ts) in tlcovs if count_params(u)==mp]
     return tlcovs_mp, mp
 
+"""
+Per-cover metric and extremum used by each parsimony criterion in multiCriteriaTLCovers.
+Criteria that share a metric (e.g. min and max forest size) share its computation.
+"""
+_criteria_metrics = {
+    "mc": ("cardinality", min),
+    "md": ("max_depth", max),
+    "xd": ("min_depth", max),
+    "mp": ("parameters", min),
+    "fsn": ("forest_size", min),
+    "fsx": ("forest_size", max),
+}
+_metrics = {
+    "cardinality": lambda u, d_min, d_max, ts: len(u),
+    "max_depth": lambda u, d_min, d_max, ts: max(d_max),
+    "min_depth": lambda u, d_min, d_max, ts: min(d_min),
+    "parameters": lambda u, d_min, d_max, ts: len(set([param for u_ in u for param in u_[2]])),
+    "forest_size": lambda u, d_min, d_max, ts: sum(ts),
+}
+
+def multiCriteriaTLCovers(tlcovs, criteria=("mc","md","xd","mp","fsn","fsx")):
+    """
+    Prune top-level covers by several parsimony criteria in one pass over the covers.
+    Each metric is computed once per cover, however many criteria use it.
+    Inputs:
+        tlcovs: A list of top-level covers as returned by explain.
+        criteria: The labels of the criteria to apply:
+            "mc": minimum cardinality (as in minCardinalityTLCovers)
+            "md": maximum depth (as in maxDepthTLCovers)
+            "xd": minimax depth (as in minimaxDepthTLCovers)
+            "mp": minimum parameters (as in minParametersTLCovers)
+            "fsn": minimum forest size (as in minForestSizeTLCovers)
+            "fsx": maximum forest size (as in maxForestSizeTLCovers)
+    Outputs:
+        pruned: A dict mapping each label to the pair (pruned top level covers, extremum found),
+            the same output as the corresponding single-criterion function.
+    """
+    values = {}
+    for label in criteria:
+        metric, _ = _criteria_metrics[label]
+        if metric not in values:
+            values[metric] = [_metrics[metric](u,d_min,d_max,ts) for (u,_,d_min,d_max,ts) in tlcovs]
+    pruned = {}
+    for label in criteria:
+        metric, extreme = _criteria_metrics[label]
+        extremum = extreme(values[metric])
+        pruned[label] = ([t for (t,x) in zip(tlcovs, values[metric]) if x == extremum], extremum)
+    return pruned
+
 def logCovers(covers, log_file, include_states=False):
     for c in range(len(covers)):
         cover = covers[c]
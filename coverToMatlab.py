@@ -1,34 +1,35 @@
-def coverToMatlab(cover, fname):
+def coverToMatlab(cover, fname, verbose=False):
     # cover is (u,k) pair
-    matFile = open(fname, "w")
-    matFile.write("% demo var d should be in calling workspace\n");
-    matFile.write("e = struct('task',{});\n")
+    # verbose: if True, print each task name and argument as it is written
+    # the document is accumulated in lines and written all at once
+    lines = []
+    lines.append("% demo var d should be in calling workspace\n");
+    lines.append("e = struct('task',{});\n")
     for (u,k) in zip(cover[0],cover[1][1:]):
-        print(u[1])
-        taskstr = "e(end+1).task = HTN.groundedTask('%s', {"%u[1]
+        if verbose: print(u[1])
+        lines.append("e(end+1).task = HTN.groundedTask('%s', {"%u[1])
         for arg in u[2]:
-            print(arg)
+            if verbose: print(arg)
             if type(arg)==str:
-                taskstr += "'%s', "%arg
+                lines.append("'%s', "%arg)
             if type(arg) in [int, float]:
-                taskstr += "%f, "%arg
+                lines.append("%f, "%arg)
             if type(arg)==tuple: # matrix or state
                 if len(arg) > 0 and len(arg[0]) > 0 and type(arg[0][0]) == str: # state
-                    taskstr += "d(%d).state, "%k # state index in demo
+                    lines.append("d(%d).state, "%k) # state index in demo
                 else:
-                    taskstr += "["
-                    for r in range(len(arg)):
-                        for c in range(len(arg[r])):
-                            taskstr += "%f, "%arg[r][c]
-                        taskstr += "; "
-                    taskstr += "], ";
-            if arg==None: # matching state
-                taskstr += "d(%d).state, "%k # state index in demo
-        taskstr += "});\n";
-        matFile.write(taskstr)
-        matFile.write("e(end).i = %d;\n"%k)
-        matFile.write("e(end).state = d(%d).state;\n"%k)
-    matFile.close()
+                    lines.append("[")
+                    for row in arg:
+                        lines.append("".join(["%f, "%c for c in row]))
+                        lines.append("; ")
+                    lines.append("], ")
+            if arg is None: # matching state
+                lines.append("d(%d).state, "%k) # state index in demo
+        lines.append("});\n")
+        lines.append("e(end).i = %d;\n"%k)
+        lines.append("e(end).state = d(%d).state;\n"%k)
+    with open(fname, "w") as matFile:
+        matFile.write("".join(lines))
 
 def main():
     cover = (
@@ -7,20 +7,26 @@ import copct
 class DescriptiveKnowledgeBase:
     def __init__(self):
         self.causal_relation = set()
+        self._by_schemata = {} # schemata -> names of all causes with those effect schemata
+        self._causes_cache = {} # memoized causes, invalidated whenever the relation grows
     def grow(self, name, covers):
         for cover in covers:
             u, _, _, _, _ = cover
-            schemata = tuple([(sub_name, len(args)) for (_, sub_name, args) in u])
+            schemata = tuple((sub_name, len(args)) for (_, sub_name, args) in u)
             self.causal_relation.add((name, schemata))
+            self._by_schemata.setdefault(schemata, set()).add(name)
+        self._causes_cache.clear()
     def causes(self, v):
+        if v in self._causes_cache: return self._causes_cache[v]
         state = v[0][0]
-        v_schemata = tuple([(name, len(args)) for (_, name, args) in v])
-        all_args = tuple([a for (_, _, args) in v for a in args])
-        u = set([(state, name, all_args) for (name, schemata) in self.causal_relation if schemata == v_schemata])
+        v_schemata = tuple((name, len(args)) for (_, name, args) in v)
+        all_args = tuple(a for (_, _, args) in v for a in args)
+        u = frozenset([(state, name, all_args) for name in self._by_schemata.get(v_schemata, ())])
+        self._causes_cache[v] = u
         return u
     def make_heterogenous_causes(self, operational_causes):
         def causes(v):
-            return self.causes(v) | operational_causes(v)
+            return self.causes(v).union(operational_causes(v))
         return causes
 
 if __name__ == "__main__":
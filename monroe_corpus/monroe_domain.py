@@ -1,8 +1,9 @@
 """
 The Monroe domain knowledge base, re-encoded as a copct causal relation.
-The causes function is implemented with two separate sub-routines:
+The causes function dispatches to two separate sets of rules:
 One for the top-level causes, and one for all other mid-level causes.
-This way the top-level causes can be easily omitted in the modified Monroe experiments.
+This way the top-level causes can be easily omitted in the modified Monroe experiments,
+by passing include_top=False (or using mid_causes).
 
 The causes functions have a separate case for each rule in the original knowledge base.
 Original lisp rule for each case is copied verbatim in the comments.
@@ -18,30 +19,98 @@ For example, a GET-TO will be missing if things are already where they need to b
 Additional cases are included in the causes implementation for these situations.
 
 """
-from monroe_static import locs, watercos, powercos, poslocs, sleaders, gens, food, pcrews
-from monroe_utils import unify, single_unify
+import sys
+import functools
+import itertools
+try:
+    from .monroe_static import locs, watercos, powercos, poslocs, sleaders, gens, food, pcrews, dumps
+    from .monroe_utils import index_facts, indexed_unify, single_unify
+except ImportError: # run as a script from within monroe_corpus
+    from monroe_static import locs, watercos, powercos, poslocs, sleaders, gens, food, pcrews, dumps
+    from monroe_utils import index_facts, indexed_unify, single_unify
 
 """
 M: maximum length of v for all (u,v) in causal relation
 """
 M = 6
 
-def mid_causes(v):
+"""
+Static cross products of parameter values, computed once instead of on every call.
+poslocs_pairs: every (fromloc, toloc) pair of possible locations
+watercos_pairs: dict mapping each water company onto its (fromloc, toloc) pairs
+"""
+poslocs_pairs = tuple((fromloc, toloc) for fromloc in poslocs for toloc in poslocs)
+watercos_pairs = {waterco: tuple((fromloc, toloc) for fromloc in watercos[waterco] for toloc in poslocs) for waterco in watercos}
+
+def intern_plan(w):
     """
-    Encodes all mid-level causal relations in the knowledge base.
+    Intern the task names and parameters of every (state, taskname, parameters) element of a plan.
+    The dispatch tables and static names are interned, so lookups and comparisons then succeed by identity.
+    """
+    return tuple((state, sys.intern(taskname), tuple(map(sys.intern, args))) for (state, taskname, args) in w)
+
+@functools.lru_cache(maxsize=1024)
+def _state_objects(objs):
+    """
+    Sort out the objects of a state that some rules iterate over.
     Inputs:
-        v: A sequence of tasks in the form (state, taskname, parameters)
-            Each state has the form (objects, facts)
+        objs: the objects tuple of a state
     Outputs:
-        g: The set of all possible causes of v, each also in the form (state, taskname, parameters).
+        crews: frozenset of the power crews among objs
+        persons: frozenset of the persons among objs
+    Results are cached, since the same objects tuple is shared by many states.
+    """
+    objs = frozenset(objs)
+    crews = objs.intersection(pcrews)
+    persons = frozenset(obj for obj in objs if obj.startswith('PERSON'))
+    return crews, persons
+
+@functools.lru_cache(maxsize=1024)
+def _all_pairs_causes(state, taskname):
     """
-    states = tuple(s for (s,t,x) in v) # states (each of the form (objs, facts))
-    tasknames = tuple(t for (s,t,x) in v) # Task names
-    params = tuple((None,)+x for (s,t,x) in v) # Parameter lists, leading None for task name offset
-    g = set()
+    The causes (state, taskname, (fromloc, toloc)) for every pair in poslocs_pairs.
+    Rules that cannot narrow down their locations emit all of these at once,
+    so the frozenset is built once per state and merged into g in a single union.
+    """
+    return frozenset((state, taskname, fromloc_toloc) for fromloc_toloc in poslocs_pairs)
+
+"""
+Each rule in the knowledge base is implemented by a handler function.
+Handlers are registered in a dispatch table under the tasknames sequence(s) they explain,
+so that causes only runs the handlers whose pattern matches v.
+Each table is a tuple indexed by pattern length, holding dicts keyed by the first taskname of each pattern,
+so that len(v) and the first task of v rule out most windows before the whole tasknames tuple is built.
+Every handler takes the states and parameters of v in the form built by the causes functions,
+and adds each cause it finds to the set g.
+"""
+_mid_handlers = tuple({} for _ in range(M+1)) # mid-level rules: length -> first taskname -> tasknames -> list of handlers
+_top_handlers = tuple({} for _ in range(M+1)) # top-level rules: length -> first taskname -> tasknames -> list of handlers
+
+def _rule(handlers, *patterns):
     """
-    ;; clean-up-hazard
-    (:method (clean-up-hazard ?from ?to)
+    Decorator that registers a handler in a dispatch table under one or more tasknames patterns.
+    """
+    def register(handler):
+        for tasknames in patterns:
+            tasknames = tuple(map(sys.intern, tasknames))
+            handlers[len(tasknames)].setdefault(tasknames[0], {}).setdefault(tasknames, []).append(handler)
+        return handler
+    return register
+
+def _unordered(subtasks, before=(), after=()):
+    """
+    All tasknames patterns for an (:unordered ...) block of subtasks.
+    Inputs:
+        subtasks: tuple of the tasknames in the unordered block
+        before, after: tuples of the ordered tasknames around the block
+    Outputs:
+        patterns: tuple of every distinct ordering, each wrapped in before and after
+    """
+    return tuple(dict.fromkeys(before + order + after for order in itertools.permutations(subtasks)))
+
+"""
+;; clean-up-hazard
+(:method (clean-up-hazard ?from ?to)
 	   very-hazardous ;; just call the feds
 	   ((hazard-seriousness ?from ?to very-hazardous))
 	   ((!call fema))
@@ -49,52 +118,61 @@ def mid_causes(v):
 	   normal ;; we can take care of it
 	   ((hazard-team ?ht))
 	   ((get-to ?ht ?from) (!clean-hazard ?ht ?from ?to)))
-    """
-    if tasknames == ('!CALL',) and params[0][1] == 'FEMA':
-        m = unify(states[0][1], ('HAZARD-SERIOUSNESS', None, None, 'VERY-HAZARDOUS'))
-        for (fromloc, toloc) in m:
-            g.add((states[0],'CLEAN-UP-HAZARD', (fromloc, toloc)))
-    if tasknames == ('GET-TO','!CLEAN-HAZARD'):
-        fromloc, toloc = params[1][2], params[1][3]
-        if fromloc == params[0][2]:
-            g.add((states[0],'CLEAN-UP-HAZARD', (fromloc, toloc)))
-    # Missing get-to
-    if tasknames == ('!CLEAN-HAZARD',):
-        fromloc, toloc = params[0][2], params[0][3]
+"""
+# The very-hazardous branch, (!call fema), is handled by _call below.
+@_rule(_mid_handlers, ('GET-TO','!CLEAN-HAZARD'))
+def _clean_up_hazard(states, params, g):
+    fromloc, toloc = params[1][1], params[1][2]
+    if fromloc == params[0][1]:
         g.add((states[0],'CLEAN-UP-HAZARD', (fromloc, toloc)))
-    """
-    ;; block-road - blocks off a road
-    (:method (block-road ?from ?to)
+
+# Missing get-to
+@_rule(_mid_handlers, ('!CLEAN-HAZARD',))
+def _clean_up_hazard_no_get_to(states, params, g):
+    fromloc, toloc = params[0][1], params[0][2]
+    g.add((states[0],'CLEAN-UP-HAZARD', (fromloc, toloc)))
+
+"""
+;; block-road - blocks off a road
+(:method (block-road ?from ?to)
 	   normal
 	   ((police-unit ?police))
-    (:unordered (set-up-cones ?from ?to)
+(:unordered (set-up-cones ?from ?to)
 	    (get-to ?police ?from)))
-    """
-    if tasknames == ('SET-UP-CONES','GET-TO'):
-        fromloc, toloc = params[0][1], params[0][2]
-        if fromloc == params[1][2]:
-            g.add((states[0],'BLOCK-ROAD', (fromloc, toloc)))
-    if tasknames == ('GET-TO','SET-UP-CONES'):
-        fromloc, toloc = params[1][1], params[1][2]
-        if fromloc == params[0][2]:
-            g.add((states[0],'BLOCK-ROAD', (fromloc, toloc)))
-    # Missing get-to
-    if tasknames == ('SET-UP-CONES',):
-        fromloc, toloc = params[0][1], params[0][2]
+"""
+@_rule(_mid_handlers, ('SET-UP-CONES','GET-TO'))
+def _block_road_cones_first(states, params, g):
+    fromloc, toloc = params[0][0], params[0][1]
+    if fromloc == params[1][1]:
         g.add((states[0],'BLOCK-ROAD', (fromloc, toloc)))
-    """
-    ;; unblock-road - unblocks a road
-    (:method (unblock-road ?from ?to)
+
+@_rule(_mid_handlers, ('GET-TO','SET-UP-CONES'))
+def _block_road_get_to_first(states, params, g):
+    fromloc, toloc = params[1][0], params[1][1]
+    if fromloc == params[0][1]:
+        g.add((states[0],'BLOCK-ROAD', (fromloc, toloc)))
+
+# Missing get-to
+@_rule(_mid_handlers, ('SET-UP-CONES',))
+def _block_road_no_get_to(states, params, g):
+    fromloc, toloc = params[0][0], params[0][1]
+    g.add((states[0],'BLOCK-ROAD', (fromloc, toloc)))
+
+"""
+;; unblock-road - unblocks a road
+(:method (unblock-road ?from ?to)
 	   normal
 	   ()
 	   ((take-down-cones ?from ?to)))
-    """
-    if tasknames == ('TAKE-DOWN-CONES',):
-        fromloc, toloc = params[0][1], params[0][2]
-        g.add((states[0],'UNBLOCK-ROAD', (fromloc, toloc)))
-    """
-    ;; get-electricity provides electricity to a site (if not already there)
-    (:method (get-electricity ?loc)
+"""
+@_rule(_mid_handlers, ('TAKE-DOWN-CONES',))
+def _unblock_road(states, params, g):
+    fromloc, toloc = params[0][0], params[0][1]
+    g.add((states[0],'UNBLOCK-ROAD', (fromloc, toloc)))
+
+"""
+;; get-electricity provides electricity to a site (if not already there)
+(:method (get-electricity ?loc)
 	   already-has-electricity ;; do nothing
 	   ((not (no-electricity ?loc)))
 	   ()
@@ -102,13 +180,15 @@ def mid_causes(v):
 	   ()
 	   ((generate-temp-electricity ?loc))
 	   )
-    """
-    if tasknames == ('GENERATE-TEMP-ELECTRICITY',):
-        loc = params[0][1]
-        g.add((states[0],'GET-ELECTRICITY', (loc,)))
-    """
-    ;; repair-pipe
-    (:method (repair-pipe ?from ?to) ;; repairs a pipe at location
+"""
+@_rule(_mid_handlers, ('GENERATE-TEMP-ELECTRICITY',))
+def _get_electricity(states, params, g):
+    loc = params[0][0]
+    g.add((states[0],'GET-ELECTRICITY', (loc,)))
+
+"""
+;; repair-pipe
+(:method (repair-pipe ?from ?to) ;; repairs a pipe at location
 	   normal
 	   ((water-crew ?crew))
 	   ((get-to ?crew ?from)
@@ -117,254 +197,308 @@ def mid_causes(v):
 	    (!replace-pipe ?crew ?from ?to)
 	    (close-hole ?from ?to)
 	    (take-down-cones ?from ?to)))
-    """
-    if tasknames == ('GET-TO','SET-UP-CONES','OPEN-HOLE','!REPLACE-PIPE','CLOSE-HOLE','TAKE-DOWN-CONES'):
-        fromloc, toloc = params[0][2], params[1][2]
-        if (fromloc == params[1][1] == params[2][1] == params[3][2] == params[4][1] == params[5][1]) and (toloc == params[2][2] == params[3][3] == params[4][2] == params[5][2]): 
-            g.add((states[0],'REPAIR-PIPE', (fromloc, toloc)))
-    # Missing get-to
-    if tasknames == ('SET-UP-CONES','OPEN-HOLE','!REPLACE-PIPE','CLOSE-HOLE','TAKE-DOWN-CONES'):
-        fromloc, toloc = params[0][1], params[0][2]
-        if (fromloc == params[1][1] == params[2][2] == params[3][1] == params[4][1]) and (toloc == params[2][3] == params[3][2] == params[4][2]): 
-            g.add((states[0],'REPAIR-PIPE', (fromloc, toloc)))
-    """
-    ;; open-hole
-    (:method (open-hole ?from ?to) ;; opens a hole in the street
+"""
+@_rule(_mid_handlers, ('GET-TO','SET-UP-CONES','OPEN-HOLE','!REPLACE-PIPE','CLOSE-HOLE','TAKE-DOWN-CONES'))
+def _repair_pipe(states, params, g):
+    p0, p1, p2, p3, p4, p5 = params
+    fromloc, toloc = p0[1], p1[1]
+    if (fromloc == p1[0] == p2[0] == p3[1] == p4[0] == p5[0]) and (toloc == p2[1] == p3[2] == p4[1] == p5[1]):
+        g.add((states[0],'REPAIR-PIPE', (fromloc, toloc)))
+
+# Missing get-to
+@_rule(_mid_handlers, ('SET-UP-CONES','OPEN-HOLE','!REPLACE-PIPE','CLOSE-HOLE','TAKE-DOWN-CONES'))
+def _repair_pipe_no_get_to(states, params, g):
+    p0, p1, p2, p3, p4 = params
+    fromloc, toloc = p0[0], p0[1]
+    if (fromloc == p1[0] == p2[1] == p3[0] == p4[0]) and (toloc == p2[2] == p3[1] == p4[1]):
+        g.add((states[0],'REPAIR-PIPE', (fromloc, toloc)))
+
+"""
+;; open-hole
+(:method (open-hole ?from ?to) ;; opens a hole in the street
 	   normal
 	   ((backhoe ?backhoe))
 	   ((get-to ?backhoe ?from)
 	    (!dig ?backhoe ?from)))
-    """
-    if tasknames == ('GET-TO','!DIG'):
-        fromloc = params[0][2]
-        if fromloc == params[1][2]:
-            for toloc in poslocs:
-                g.add((states[0],'OPEN-HOLE', (fromloc, toloc)))
-    # Missing get-to
-    if tasknames == ('!DIG',):
-        fromloc = params[0][2]
-        for toloc in poslocs:
-            g.add((states[0],'OPEN-HOLE', (fromloc, toloc)))
-    """
-    ;; close-hole
-    (:method (close-hole ?from ?to) ;; opens a hole in the street
+"""
+@_rule(_mid_handlers, ('GET-TO','!DIG'))
+def _open_hole(states, params, g):
+    state = states[0]
+    fromloc = params[0][1]
+    if fromloc == params[1][1]:
+        g.update((state,'OPEN-HOLE', (fromloc, toloc)) for toloc in poslocs)
+
+# Missing get-to
+@_rule(_mid_handlers, ('!DIG',))
+def _open_hole_no_get_to(states, params, g):
+    state = states[0]
+    fromloc = params[0][1]
+    g.update((state,'OPEN-HOLE', (fromloc, toloc)) for toloc in poslocs)
+
+"""
+;; close-hole
+(:method (close-hole ?from ?to) ;; opens a hole in the street
 	   normal
 	   ((backhoe ?backhoe))
 	   ((get-to ?backhoe ?from)
 	    (!fill-in ?backhoe ?from)))
-    """
-    if tasknames == ('GET-TO','!FILL-IN'):
-        fromloc = params[0][2]
-        if fromloc == params[1][2]:
-            for toloc in poslocs:
-                g.add((states[0],'CLOSE-HOLE', (fromloc, toloc)))
-    # Missing get-to
-    if tasknames == ('!FILL-IN',):
-        fromloc = params[0][2]
-        for toloc in poslocs:
-            g.add((states[0],'CLOSE-HOLE', (fromloc, toloc)))
-    """
-    ;; set-up-cones
-    (:method (set-up-cones ?from ?to) ;; sets up orange cones at road
+"""
+@_rule(_mid_handlers, ('GET-TO','!FILL-IN'))
+def _close_hole(states, params, g):
+    state = states[0]
+    fromloc = params[0][1]
+    if fromloc == params[1][1]:
+        g.update((state,'CLOSE-HOLE', (fromloc, toloc)) for toloc in poslocs)
+
+# Missing get-to
+@_rule(_mid_handlers, ('!FILL-IN',))
+def _close_hole_no_get_to(states, params, g):
+    state = states[0]
+    fromloc = params[0][1]
+    g.update((state,'CLOSE-HOLE', (fromloc, toloc)) for toloc in poslocs)
+
+"""
+;; set-up-cones
+(:method (set-up-cones ?from ?to) ;; sets up orange cones at road
 	   normal
 	   ((work-crew ?crew))
 	   ((get-to ?crew ?from) (!place-cones ?crew)))
-    """
-    if tasknames == ('GET-TO','!PLACE-CONES'):
-        fromloc = params[0][2]
-        for toloc in poslocs:
-            g.add((states[0],'SET-UP-CONES', (fromloc, toloc)))
-    # Missing get-to
-    if tasknames == ('!PLACE-CONES',):
-        crew = params[0][1]
-        m = unify(states[0][1], ('ATLOC', crew, None))
-        # crew could be at both a town and posloc within a town
-        if len(m)==1:
-            fromloc = m.pop()[0]
-            for toloc in poslocs:
-                g.add((states[0],'SET-UP-CONES', (fromloc, toloc)))
-        else:
-            for fromloc in poslocs:
-                for toloc in poslocs:
-                    g.add((states[0],'SET-UP-CONES', (fromloc, toloc)))
-    """
-    ;; take-down-cones
-    (:method (take-down-cones ?from ?to) ;; takes down cones
+"""
+@_rule(_mid_handlers, ('GET-TO','!PLACE-CONES'))
+def _set_up_cones(states, params, g):
+    state = states[0]
+    fromloc = params[0][1]
+    g.update((state,'SET-UP-CONES', (fromloc, toloc)) for toloc in poslocs)
+
+# Missing get-to
+@_rule(_mid_handlers, ('!PLACE-CONES',))
+def _set_up_cones_no_get_to(states, params, g):
+    state = states[0]
+    crew = params[0][0]
+    m = indexed_unify(state[1], ('ATLOC', crew, None))
+    # crew could be at both a town and posloc within a town
+    if len(m)==1:
+        fromloc = m.pop()[0]
+        g.update((state,'SET-UP-CONES', (fromloc, toloc)) for toloc in poslocs)
+    else:
+        g |= _all_pairs_causes(state, 'SET-UP-CONES')
+
+"""
+;; take-down-cones
+(:method (take-down-cones ?from ?to) ;; takes down cones
 	   normal
 	   ((work-crew ?crew))
 	   ((get-to ?crew ?from) (!pickup-cones ?crew)))
-    """
-    if tasknames == ('GET-TO','!PICKUP-CONES'):
-        fromloc = params[0][2]
-        for toloc in poslocs:
-            g.add((states[0],'TAKE-DOWN-CONES', (fromloc, toloc)))
-    # Missing get-to
-    if tasknames == ('!PICKUP-CONES',):
-        crew = params[0][1]
-        m = unify(states[0][1], ('ATLOC', crew, None))
-        # crew could be at both a town and posloc within a town
-        if len(m)==1:
-            fromloc = m.pop()[0]
-            for toloc in poslocs:
-                g.add((states[0],'TAKE-DOWN-CONES', (fromloc, toloc)))
-        else:
-            for fromloc in poslocs:
-                for toloc in poslocs:
-                    g.add((states[0],'TAKE-DOWN-CONES', (fromloc, toloc)))
-    """
-    ;; clear-wreck
-    (:method (clear-wreck ?from ?to) ;; gets rid of a wreck in any loc
+"""
+@_rule(_mid_handlers, ('GET-TO','!PICKUP-CONES'))
+def _take_down_cones(states, params, g):
+    state = states[0]
+    fromloc = params[0][1]
+    g.update((state,'TAKE-DOWN-CONES', (fromloc, toloc)) for toloc in poslocs)
+
+# Missing get-to
+@_rule(_mid_handlers, ('!PICKUP-CONES',))
+def _take_down_cones_no_get_to(states, params, g):
+    state = states[0]
+    crew = params[0][0]
+    m = indexed_unify(state[1], ('ATLOC', crew, None))
+    # crew could be at both a town and posloc within a town
+    if len(m)==1:
+        fromloc = m.pop()[0]
+        g.update((state,'TAKE-DOWN-CONES', (fromloc, toloc)) for toloc in poslocs)
+    else:
+        g |= _all_pairs_causes(state, 'TAKE-DOWN-CONES')
+
+"""
+;; clear-wreck
+(:method (clear-wreck ?from ?to) ;; gets rid of a wreck in any loc
 	   normal
 	   ((wrecked-vehicle ?from ?to ?veh) (garbage-dump ?dump))
 	   ((tow-to ?veh ?dump)))
-    """
-    if tasknames == ('TOW-TO',):
-        m = unify(states[0][1], ('WRECKED-VEHICLE', None, None, None))
-        for (fromloc, toloc, veh) in m:
-            g.add((states[0],'CLEAR-WRECK', (fromloc, toloc)))
-    """
-    ;; tow-to - tows a vehicle somewhere
-    (:method (tow-to ?veh ?to)
+"""
+@_rule(_mid_handlers, ('TOW-TO',))
+def _clear_wreck(states, params, g):
+    state = states[0]
+    m = indexed_unify(state[1], ('WRECKED-VEHICLE', None, None, None))
+    g.update((state,'CLEAR-WRECK', (fromloc, toloc)) for (fromloc, toloc, veh) in m)
+
+"""
+;; tow-to - tows a vehicle somewhere
+(:method (tow-to ?veh ?to)
 	   normal
 	   ((tow-truck ?ttruck) (vehicle ?veh) (atloc ?veh ?vehloc))
 	   ((get-to ?ttruck ?vehloc)
 	    (!hook-to-tow-truck ?ttruck ?veh)
 	    (get-to ?ttruck ?to)
 	    (!unhook-from-tow-truck ?ttruck ?veh)))
-    """
-    if tasknames == ('GET-TO','!HOOK-TO-TOW-TRUCK','GET-TO','!UNHOOK-FROM-TOW-TRUCK'):
-        veh, toloc = params[1][2], params[2][2]
-        g.add((states[0],'TOW-TO', (veh, toloc)))
-    # Missing get-to branches
-    if tasknames == ('!HOOK-TO-TOW-TRUCK','GET-TO','!UNHOOK-FROM-TOW-TRUCK'):
-        veh, toloc = params[0][2], params[1][2]
-        g.add((states[0],'TOW-TO', (veh, toloc)))
-    if tasknames == ('GET-TO','!HOOK-TO-TOW-TRUCK','!UNHOOK-FROM-TOW-TRUCK'):
-        veh = params[1][2]
-        for toloc in ['BRIGHTON-DUMP','HENRIETTA-DUMP']:
-            g.add((states[0],'TOW-TO', (veh, toloc)))
-    if tasknames == ('!HOOK-TO-TOW-TRUCK','!UNHOOK-FROM-TOW-TRUCK'):
-        veh = params[0][2]
-        for toloc in ['BRIGHTON-DUMP','HENRIETTA-DUMP']:
-            g.add((states[0],'TOW-TO', (veh, toloc)))
-    """
-    ;; clear-tree
-    (:method (clear-tree ?tree) ;; this gets rid of a tree in any loc
+"""
+@_rule(_mid_handlers, ('GET-TO','!HOOK-TO-TOW-TRUCK','GET-TO','!UNHOOK-FROM-TOW-TRUCK'))
+def _tow_to(states, params, g):
+    veh, toloc = params[1][1], params[2][1]
+    g.add((states[0],'TOW-TO', (veh, toloc)))
+
+# Missing get-to branches
+@_rule(_mid_handlers, ('!HOOK-TO-TOW-TRUCK','GET-TO','!UNHOOK-FROM-TOW-TRUCK'))
+def _tow_to_no_first_get_to(states, params, g):
+    veh, toloc = params[0][1], params[1][1]
+    g.add((states[0],'TOW-TO', (veh, toloc)))
+
+@_rule(_mid_handlers, ('GET-TO','!HOOK-TO-TOW-TRUCK','!UNHOOK-FROM-TOW-TRUCK'))
+def _tow_to_no_second_get_to(states, params, g):
+    state = states[0]
+    veh = params[1][1]
+    g.update((state,'TOW-TO', (veh, toloc)) for toloc in dumps)
+
+@_rule(_mid_handlers, ('!HOOK-TO-TOW-TRUCK','!UNHOOK-FROM-TOW-TRUCK'))
+def _tow_to_no_get_to(states, params, g):
+    state = states[0]
+    veh = params[0][1]
+    g.update((state,'TOW-TO', (veh, toloc)) for toloc in dumps)
+
+"""
+;; clear-tree
+(:method (clear-tree ?tree) ;; this gets rid of a tree in any loc
 	   normal
 	   ((tree-crew ?tcrew) (tree ?tree) 
 	    (atloc ?tree ?treeloc))
 	   ((get-to ?tcrew ?treeloc) (!cut-tree ?tcrew ?tree)
 	    (remove-blockage ?tree)))
-    """
-    if tasknames == ('GET-TO','!CUT-TREE','REMOVE-BLOCKAGE'):
-        tree = params[1][2]
-        g.add((states[0],'CLEAR-TREE', (tree,)))
-    # Missing get-to
-    if tasknames == ('GET-TO','!CUT-TREE'):
-        tree = params[1][2]
-        g.add((states[0],'CLEAR-TREE', (tree,)))
-    if tasknames == ('!CUT-TREE','REMOVE-BLOCKAGE'):
-        tree = params[0][2]
-        g.add((states[0],'CLEAR-TREE', (tree,)))
-    if tasknames == ('!CUT-TREE'):
-        tree = params[0][2]
-        g.add((states[0],'CLEAR-TREE', (tree,)))
-    """
-    ;; remove-blockage
-    (:method (remove-blockage ?stuff)
+"""
+@_rule(_mid_handlers, ('GET-TO','!CUT-TREE','REMOVE-BLOCKAGE'))
+def _clear_tree(states, params, g):
+    tree = params[1][1]
+    g.add((states[0],'CLEAR-TREE', (tree,)))
+
+# Missing get-to
+@_rule(_mid_handlers, ('GET-TO','!CUT-TREE'))
+def _clear_tree_no_remove_blockage(states, params, g):
+    tree = params[1][1]
+    g.add((states[0],'CLEAR-TREE', (tree,)))
+
+@_rule(_mid_handlers, ('!CUT-TREE','REMOVE-BLOCKAGE'))
+def _clear_tree_no_get_to(states, params, g):
+    tree = params[0][1]
+    g.add((states[0],'CLEAR-TREE', (tree,)))
+
+# The original cascade also had a (!cut-tree ?tcrew ?tree) case here, but it compared
+# tasknames with the string '!CUT-TREE' instead of a tuple, so it never matched.
+# It is left unregistered so that the causal relation is unchanged.
+"""
+;; remove-blockage
+(:method (remove-blockage ?stuff)
 	   move-to-side-of-street
 	   ((work-crew ?crew) (atloc ?stuff ?loc))
 	   ((get-to ?crew ?loc)
 	    (!carry-blockage-out-of-way ?crew ?stuff)))
-    """
-    if tasknames == ('GET-TO','!CARRY-BLOCKAGE-OUT-OF-WAY'):
-        stuff = params[1][2]
-        g.add((states[0],'REMOVE-BLOCKAGE', (stuff,)))
-    # Missing get-to
-    if tasknames == ('!CARRY-BLOCKAGE-OUT-OF-WAY',):
-        stuff = params[0][2]
-        g.add((states[0],'REMOVE-BLOCKAGE', (stuff,)))
-    """
-    (:method (remove-blockage ?stuff)
+"""
+@_rule(_mid_handlers, ('GET-TO','!CARRY-BLOCKAGE-OUT-OF-WAY'))
+def _remove_blockage(states, params, g):
+    stuff = params[1][1]
+    g.add((states[0],'REMOVE-BLOCKAGE', (stuff,)))
+
+# Missing get-to
+@_rule(_mid_handlers, ('!CARRY-BLOCKAGE-OUT-OF-WAY',))
+def _remove_blockage_no_get_to(states, params, g):
+    stuff = params[0][1]
+    g.add((states[0],'REMOVE-BLOCKAGE', (stuff,)))
+
+"""
+(:method (remove-blockage ?stuff)
 	   carry-away
 	   ((garbage-dump ?dump))
 	   ((get-to ?stuff ?dump)))
-    """
-    if tasknames == ('GET-TO',):
-        dump = params[0][2]
-        if dump in ('HENRIETTA-DUMP','BRIGHTON-DUMP'):
-            stuff = params[0][1]
-            g.add((states[0],'REMOVE-BLOCKAGE', (stuff,)))
-    """
-    ;; declare-curfew
-    (:method (declare-curfew ?town)
+"""
+@_rule(_mid_handlers, ('GET-TO',))
+def _remove_blockage_carry_away(states, params, g):
+    dump = params[0][1]
+    if dump in dumps:
+        stuff = params[0][0]
+        g.add((states[0],'REMOVE-BLOCKAGE', (stuff,)))
+
+"""
+;; declare-curfew
+(:method (declare-curfew ?town)
 	   normal
 	   ()
 	   (:unordered (!call EBS) (!call police-chief)))
-    """
-    if tasknames == ('!CALL', '!CALL'):
-        if 'EBS' in (params[0][1], params[1][1]):
-            for town in locs:
-                g.add((states[0],'DECLARE-CURFEW', (town,)))
-    """
-    ;; generate-temp-electricity
-    (:method (generate-temp-electricity ?loc)
+"""
+@_rule(_mid_handlers, *_unordered(('!CALL', '!CALL')))
+def _declare_curfew(states, params, g):
+    state = states[0]
+    if 'EBS' in (params[0][0], params[1][0]):
+        g.update((state,'DECLARE-CURFEW', (town,)) for town in locs)
+
+"""
+;; generate-temp-electricity
+(:method (generate-temp-electricity ?loc)
 	   with-generator
 	   ((generator ?gen))
 	   ((make-full-fuel ?gen) (get-to ?gen ?loc) (!hook-up ?gen ?loc)
 	    (!turn-on ?gen)))
-    """
-    if tasknames == ('MAKE-FULL-FUEL','GET-TO','!HOOK-UP','!TURN-ON'):
-        loc = params[1][2]
-        if loc == params[2][2]:
-            g.add((states[0],'GENERATE-TEMP-ELECTRICITY', (loc,)))
-    # Missing get-to
-    if tasknames == ('MAKE-FULL-FUEL','!HOOK-UP','!TURN-ON'):
-        loc = params[1][2]
+"""
+@_rule(_mid_handlers, ('MAKE-FULL-FUEL','GET-TO','!HOOK-UP','!TURN-ON'))
+def _generate_temp_electricity(states, params, g):
+    loc = params[1][1]
+    if loc == params[2][1]:
         g.add((states[0],'GENERATE-TEMP-ELECTRICITY', (loc,)))
-    """
-    ;; make-full-fuel - makes sure arg1 is full of fuel
-    (:method (make-full-fuel ?gen)
+
+# Missing get-to
+@_rule(_mid_handlers, ('MAKE-FULL-FUEL','!HOOK-UP','!TURN-ON'))
+def _generate_temp_electricity_no_get_to(states, params, g):
+    loc = params[1][1]
+    g.add((states[0],'GENERATE-TEMP-ELECTRICITY', (loc,)))
+
+"""
+;; make-full-fuel - makes sure arg1 is full of fuel
+(:method (make-full-fuel ?gen)
 	   with-gas-can
 	   ((gas-can ?gc) (atloc ?gen ?genloc) (service-station ?ss))
 	   ((get-to ?gc ?ss) (add-fuel ?ss ?gc) (get-to ?gc ?genloc)
 	    (!pour-into ?gc ?gen)))
-    """
-    if tasknames == ('GET-TO','ADD-FUEL','GET-TO','!POUR-INTO'):
-        gen = params[3][2]
-        if params[0][1] == params[1][2] == params[2][1]:
-            g.add((states[0],'MAKE-FULL-FUEL', (gen,)))
-    """
-    (:method (make-full-fuel ?gen)
+"""
+@_rule(_mid_handlers, ('GET-TO','ADD-FUEL','GET-TO','!POUR-INTO'))
+def _make_full_fuel_with_gas_can(states, params, g):
+    gen = params[3][1]
+    if params[0][0] == params[1][1] == params[2][0]:
+        g.add((states[0],'MAKE-FULL-FUEL', (gen,)))
+
+"""
+(:method (make-full-fuel ?gen)
 	   at-service-station
 	   ((service-station ?ss))
 	   ((get-to ?gen ?ss) (add-fuel ?ss ?gen)))
-    """
-    if tasknames == ('GET-TO','ADD-FUEL'):
-        if params[0][1] == params[1][2] and params[0][2] == params[1][1]:
-            gen = params[0][1]
-            g.add((states[0],'MAKE-FULL-FUEL', (gen,)))
-    # Missing get-to
-    if tasknames == ('ADD-FUEL',):
-        gen = params[0][2]
+"""
+@_rule(_mid_handlers, ('GET-TO','ADD-FUEL'))
+def _make_full_fuel_at_service_station(states, params, g):
+    if params[0][0] == params[1][1] and params[0][1] == params[1][0]:
+        gen = params[0][0]
         g.add((states[0],'MAKE-FULL-FUEL', (gen,)))
-    """
-    ;; add-fuel (at service-station)
-    (:method (add-fuel ?ss ?obj)
+
+# Missing get-to
+@_rule(_mid_handlers, ('ADD-FUEL',))
+def _make_full_fuel_no_get_to(states, params, g):
+    gen = params[0][1]
+    g.add((states[0],'MAKE-FULL-FUEL', (gen,)))
+
+"""
+;; add-fuel (at service-station)
+(:method (add-fuel ?ss ?obj)
 	   normal
 	   ()
 	   (:unordered (!pay ?ss) (!pump-gas-into ?ss ?obj)))
-    """
-    if tasknames in (('!PAY','!PUMP-GAS-INTO'), ('!PUMP-GAS-INTO','!PAY')):
-        ss = params[0][1]
-        if len(params[0]) > 2:
-            obj = params[0][2]
-        else:
-            obj = params[1][2]
-        g.add((states[0],'ADD-FUEL', (ss, obj)))
-    """
-    ;; repair-line
-    (:method (repair-line ?crew ?lineloc)
+"""
+@_rule(_mid_handlers, *_unordered(('!PAY','!PUMP-GAS-INTO')))
+def _add_fuel(states, params, g):
+    ss = params[0][0]
+    if len(params[0]) > 1:
+        obj = params[0][1]
+    else:
+        obj = params[1][1]
+    g.add((states[0],'ADD-FUEL', (ss, obj)))
+
+"""
+;; repair-line
+(:method (repair-line ?crew ?lineloc)
 	   with-tree
 	   ((tree ?tree) (atloc ?tree ?lineloc)
 	    (atloc ?crew ?lineloc))
@@ -372,108 +506,139 @@ def mid_causes(v):
 	    (:unordered (clear-tree ?tree) 
 			(!remove-wire ?crew ?lineloc))
 	    (!string-wire ?crew ?lineloc) (turn-on-power ?crew ?lineloc))
-    """
-    if tasknames in (('SHUT-OFF-POWER','CLEAR-TREE','!REMOVE-WIRE','!STRING-WIRE','TURN-ON-POWER'),('SHUT-OFF-POWER','!REMOVE-WIRE','CLEAR-TREE','!STRING-WIRE','TURN-ON-POWER')):
-        crew, lineloc = params[0][1], params[0][2]
-        g.add((states[0],'REPAIR-LINE', (crew, lineloc)))
-    """
+"""
+@_rule(_mid_handlers, *_unordered(('CLEAR-TREE','!REMOVE-WIRE'), before=('SHUT-OFF-POWER',), after=('!STRING-WIRE','TURN-ON-POWER')))
+def _repair_line_with_tree(states, params, g):
+    crew, lineloc = params[0][0], params[0][1]
+    g.add((states[0],'REPAIR-LINE', (crew, lineloc)))
+
+"""
 	   without-tree
 	   ((atloc ?crew ?lineloc))
 	   ((shut-off-power ?crew ?lineloc) 
 	    (!remove-wire ?crew ?lineloc)
 	    (!string-wire ?crew ?lineloc) (turn-on-power ?crew ?lineloc)))
-    """
-    if tasknames == ('SHUT-OFF-POWER','!REMOVE-WIRE','!STRING-WIRE','TURN-ON-POWER'):
-        crew, lineloc = params[0][1], params[0][2]
-        g.add((states[0],'REPAIR-LINE', (crew, lineloc)))
-    """
-    ;; shut-off-power
-    (:method (shut-off-power ?crew ?loc)
+"""
+@_rule(_mid_handlers, ('SHUT-OFF-POWER','!REMOVE-WIRE','!STRING-WIRE','TURN-ON-POWER'))
+def _repair_line_without_tree(states, params, g):
+    crew, lineloc = params[0][0], params[0][1]
+    g.add((states[0],'REPAIR-LINE', (crew, lineloc)))
+
+"""
+;; shut-off-power
+(:method (shut-off-power ?crew ?loc)
 	   normal
 	   ((in-town ?loc ?town) (powerco-of ?town ?powerco))
 	   (!call ?powerco))
-    """
-    if tasknames == ('!CALL',) and params[0][1] in powercos:
-        for obj in states[0][0]:
-            if obj in pcrews:
-                for loc in powercos[params[0][1]]:
-                    g.add((states[0],'SHUT-OFF-POWER', (obj, loc)))
-    """
-    ;; turn-on-power
-    (:method (turn-on-power ?crew ?loc)
+"""
+"""
+;; turn-on-power
+(:method (turn-on-power ?crew ?loc)
 	   normal
 	   ((in-town ?loc ?town) (powerco-of ?town ?powerco))
 	   (!call ?powerco))
-    """
-    if tasknames == ('!CALL',) and params[0][1] in powercos:
-        for obj in states[0][0]:
-            if obj in pcrews:
-                for loc in powercos[params[0][1]]:
-                    g.add((states[0],'TURN-ON-POWER', (obj, loc)))
-    """
-    ;; shut-off-water
-    (:method (shut-off-water ?from ?to)
+"""
+"""
+;; shut-off-water
+(:method (shut-off-water ?from ?to)
 	   normal
 	   ((in-town ?from ?town) (waterco-of ?town ?waterco))
 	   ((!call ?waterco)))
-    """
-    if tasknames == ('!CALL',) and params[0][1] in watercos:
-        for fromloc in watercos[params[0][1]]:
-            for toloc in poslocs:
-                g.add((states[0],'SHUT-OFF-WATER', (fromloc, toloc)))
-    """
-    ;; turn-on-water
-    (:method (turn-on-water ?from ?to)
+"""
+"""
+;; turn-on-water
+(:method (turn-on-water ?from ?to)
 	   normal
 	   ((in-town ?from ?town) (waterco-of ?town ?waterco))
 	   ((!call ?waterco)))
-    """
-    if tasknames == ('!CALL',) and params[0][1] in watercos:
-        for fromloc in watercos[params[0][1]]:
-            for toloc in poslocs:
-                g.add((states[0],'TURN-ON-WATER', (fromloc, toloc)))
-    """
-    ;; emt-treat
-    (:method (emt-treat ?person)
+"""
+
+# The (!call ?callee) rules are distinguished by the callee, so one handler per kind of callee
+def _call_fema(states, params, g):
+    # clean-up-hazard, very-hazardous branch
+    state = states[0]
+    m = indexed_unify(state[1], ('HAZARD-SERIOUSNESS', None, None, 'VERY-HAZARDOUS'))
+    g.update((state,'CLEAN-UP-HAZARD', (fromloc, toloc)) for (fromloc, toloc) in m)
+
+def _call_powerco(states, params, g):
+    # shut-off-power and turn-on-power
+    state = states[0]
+    callee = params[0][0]
+    crews, _ = _state_objects(state[0])
+    # both rules have the same (crew, loc) parameters, so enumerate them once
+    obj_locs = [(obj, loc) for obj in crews for loc in powercos[callee]]
+    g.update((state,'SHUT-OFF-POWER', obj_loc) for obj_loc in obj_locs)
+    g.update((state,'TURN-ON-POWER', obj_loc) for obj_loc in obj_locs)
+
+def _call_waterco(states, params, g):
+    # shut-off-water and turn-on-water
+    state = states[0]
+    # both rules have the same (fromloc, toloc) parameters, precomputed in watercos_pairs
+    fromloc_tolocs = watercos_pairs[params[0][0]]
+    g.update((state,'SHUT-OFF-WATER', fromloc_toloc) for fromloc_toloc in fromloc_tolocs)
+    g.update((state,'TURN-ON-WATER', fromloc_toloc) for fromloc_toloc in fromloc_tolocs)
+
+_call_handlers = {'FEMA': _call_fema} # callee -> handler
+_call_handlers.update((powerco, _call_powerco) for powerco in powercos)
+_call_handlers.update((waterco, _call_waterco) for waterco in watercos)
+
+@_rule(_mid_handlers, ('!CALL',))
+def _call(states, params, g):
+    # All rules whose only subtask is (!call ?callee), dispatched on the callee
+    handler = _call_handlers.get(params[0][0])
+    if handler is not None:
+        handler(states, params, g)
+
+"""
+;; emt-treat
+(:method (emt-treat ?person)
 	   emt
 	   ((emt-crew ?emt) (atloc ?person ?personloc))
 	   ((get-to ?emt ?personloc) (!treat ?emt ?person)))
-    """
-    if tasknames == ('GET-TO', '!TREAT'):
-        person = params[1][2]
-        g.add((states[0],'EMT-TREAT', (person,)))
-    # Missing get-to:
-    if tasknames == ('!TREAT',):
-        person = params[0][2]
-        g.add((states[0],'EMT-TREAT', (person,)))
-    """
-    ;; stabilize
-    (:method (stabilize ?person)
+"""
+@_rule(_mid_handlers, ('GET-TO', '!TREAT'))
+def _emt_treat(states, params, g):
+    person = params[1][1]
+    g.add((states[0],'EMT-TREAT', (person,)))
+
+# Missing get-to:
+@_rule(_mid_handlers, ('!TREAT',))
+def _emt_treat_no_get_to(states, params, g):
+    person = params[0][1]
+    g.add((states[0],'EMT-TREAT', (person,)))
+
+"""
+;; stabilize
+(:method (stabilize ?person)
 	   emt
 	   ()
 	   ((emt-treat ?person)))
-    """
-    if tasknames == ('EMT-TREAT',):
-        person = params[0][1]
-        g.add((states[0],'STABILIZE', (person,)))
-    """
-    ;; get-to
-    (:method (get-to ?obj ?place)
+"""
+@_rule(_mid_handlers, ('EMT-TREAT',))
+def _stabilize(states, params, g):
+    person = params[0][0]
+    g.add((states[0],'STABILIZE', (person,)))
+
+"""
+;; get-to
+(:method (get-to ?obj ?place)
 	   already-there
 	   ((atloc ?obj ?place))
 	   ())
-    (:method (get-to ?person ?place)
+(:method (get-to ?person ?place)
 	   person-drives-themself
 	   ((not (atloc ?person ?place))
 	    (person ?person) (vehicle ?veh) (atloc ?veh ?vehloc)
 	    (atloc ?person ?vehloc))
 	   ((drive-to ?person ?veh ?place)))
-    """
-    if tasknames == ('DRIVE-TO',):
-        person, place = params[0][1], params[0][3]
-        g.add((states[0],'GET-TO', (person, place)))
-    """
-    (:method (get-to ?veh ?place)
+"""
+@_rule(_mid_handlers, ('DRIVE-TO',))
+def _get_to_person_drives_themself(states, params, g):
+    person, place = params[0][0], params[0][2]
+    g.add((states[0],'GET-TO', (person, place)))
+
+"""
+(:method (get-to ?veh ?place)
 	   vehicle-gets-driven
 	   ((not (atloc ?veh ?place))
 	    (person ?person)
@@ -481,12 +646,14 @@ def mid_causes(v):
 	    (atloc ?person ?vehloc)
 	    )
 	   ((drive-to ?person ?veh ?place)))
-    """
-    if tasknames == ('DRIVE-TO',):
-        veh, place = params[0][2], params[0][3]
-        g.add((states[0],'GET-TO', (veh, place)))
-    """
-    (:method (get-to ?obj ?place)
+"""
+@_rule(_mid_handlers, ('DRIVE-TO',))
+def _get_to_vehicle_gets_driven(states, params, g):
+    veh, place = params[0][1], params[0][2]
+    g.add((states[0],'GET-TO', (veh, place)))
+
+"""
+(:method (get-to ?obj ?place)
 	   as-cargo
 	   ((not (atloc ?obj ?place))
 	   (vehicle ?veh)
@@ -494,50 +661,60 @@ def mid_causes(v):
 	   (not (non-ambulatory ?obj)))
 	   ((get-to ?veh ?objloc) (get-in ?obj ?veh) (get-to ?veh ?place)
 	    (get-out ?obj ?veh))
-    """
-    if tasknames == ('GET-TO','GET-IN','GET-TO','GET-OUT'):
-        veh, obj, place = params[0][1], params[1][1], params[2][2]
-        if (veh == params[1][2] == params[2][1] == params[3][2]) and (obj == params[3][1]):
-            g.add((states[0],'GET-TO', (obj, place)))
-            if obj[:3]=='GEN': # deal with monroe bug?
-                g.add((states[0],'GET-TO', (obj, 'TEXACO1')))
-    # Missing get-to
-    if tasknames == ('GET-IN','GET-TO','GET-OUT'):
-        veh, obj, place = params[0][2], params[0][1], params[1][2]
-        if (veh == params[0][2] == params[1][1] == params[2][2]) and (obj == params[2][1]):
-            g.add((states[0],'GET-TO', (obj, place)))
-            if obj[:3]=='GEN': # monroe bug?
-                g.add((states[0],'GET-TO', (obj, 'TEXACO1')))
-    if tasknames == ('GET-TO','GET-IN','GET-OUT'):
-        veh, obj = params[1][2], params[1][1]
-        if (veh == params[0][1] == params[2][2]) and (obj == params[2][1]):
-            m = unify(states[2][1], ('ATLOC', veh, None))
-            if len(m)==1:
-                place = m.pop()[0]
-                g.add((states[0],'GET-TO', (obj, place)))
-            else:
-                for loc in poslocs:
-                    g.add((states[0],'GET-TO',(obj,loc)))
-            if obj[:3]=='GEN': # monroe bug?
-                g.add((states[0],'GET-TO', (obj, 'TEXACO1')))
-    if tasknames == ('GET-IN','GET-OUT'):
-        veh, obj = params[1][2], params[1][1]
-        if (veh == params[0][2]) and (obj == params[0][1]):
-            m = unify(states[1][1], ('ATLOC', veh, None))
+"""
+@_rule(_mid_handlers, ('GET-TO','GET-IN','GET-TO','GET-OUT'))
+def _get_to_as_cargo(states, params, g):
+    p0, p1, p2, p3 = params
+    veh, obj, place = p0[0], p1[0], p2[1]
+    if (veh == p1[1] == p2[0] == p3[1]) and (obj == p3[0]):
+        g.add((states[0],'GET-TO', (obj, place)))
+        if obj.startswith('GEN'): # deal with monroe bug?
+            g.add((states[0],'GET-TO', (obj, 'TEXACO1')))
+
+# Missing get-to
+@_rule(_mid_handlers, ('GET-IN','GET-TO','GET-OUT'))
+def _get_to_as_cargo_no_first_get_to(states, params, g):
+    p0, p1, p2 = params
+    veh, obj, place = p0[1], p0[0], p1[1]
+    if (veh == p1[0] == p2[1]) and (obj == p2[0]): # veh is p0[1] by construction
+        g.add((states[0],'GET-TO', (obj, place)))
+        if obj.startswith('GEN'): # monroe bug?
+            g.add((states[0],'GET-TO', (obj, 'TEXACO1')))
+
+@_rule(_mid_handlers, ('GET-TO','GET-IN','GET-OUT'))
+def _get_to_as_cargo_no_second_get_to(states, params, g):
+    state = states[0]
+    veh, obj = params[1][1], params[1][0]
+    if (veh == params[0][0] == params[2][1]) and (obj == params[2][0]):
+        m = indexed_unify(states[2][1], ('ATLOC', veh, None))
+        if len(m)==1:
+            place = m.pop()[0]
+            g.add((state,'GET-TO', (obj, place)))
+        else:
+            g.update((state,'GET-TO',(obj,loc)) for loc in poslocs)
+        if obj.startswith('GEN'): # monroe bug?
+            g.add((state,'GET-TO', (obj, 'TEXACO1')))
+
+@_rule(_mid_handlers, ('GET-IN','GET-OUT'))
+def _get_to_as_cargo_no_get_to(states, params, g):
+    state = states[0]
+    veh, obj = params[1][1], params[1][0]
+    if (veh == params[0][1]) and (obj == params[0][0]):
+        m = indexed_unify(states[1][1], ('ATLOC', veh, None))
+        if len(m)==1:
+            place = m.pop()[0]
+            g.add((state,'GET-TO', (obj, place)))
+        else:
+            m = indexed_unify(states[1][1], ('ATLOC', obj, None))
             if len(m)==1:
-                place = m.pop()[0]
-                g.add((states[0],'GET-TO', (obj, place)))
+                place  = m.pop()[0]
+                g.add((state,'GET-TO', (obj, place)))
             else:
-                m = unify(states[1][1], ('ATLOC', obj, None))
-                if len(m)==1:
-                    place  = m.pop()[0]
-                    g.add((states[0],'GET-TO', (obj, place)))
-                else:
-                    for loc in poslocs:
-                        g.add((states[0],'GET-TO',(obj,loc)))
-            if obj[:3]=='GEN': # monroe bug?
-                g.add((states[0],'GET-TO', (obj, 'TEXACO1')))
-    """
+                g.update((state,'GET-TO',(obj,loc)) for loc in poslocs)
+        if obj.startswith('GEN'): # monroe bug?
+            g.add((state,'GET-TO', (obj, 'TEXACO1')))
+
+"""
 	   with-ambulance ;; same as above, just with ambulance
 	   ((not (atloc ?obj ?place))
 	    (atloc ?obj ?objloc) (ambulance ?veh) (fit-in ?obj ?veh)
@@ -545,160 +722,177 @@ def mid_causes(v):
 	   ((get-to ?veh ?objloc) (stabilize ?obj) (get-in ?obj ?veh)
 	    (get-to ?veh ?place) (get-out ?obj ?veh))
 	   )
-    """
-    if tasknames == ('GET-TO','STABILIZE','GET-IN','GET-TO','GET-OUT'):
-        veh, obj, place = params[0][1], params[1][1], params[3][2]
-        if (veh == params[2][2] == params[3][1] == params[4][2]) and (obj == params[2][1] == params[4][1]):
-            g.add((states[0],'GET-TO', (obj, place)))
-    # Missing get-to
-    if tasknames == ('STABILIZE','GET-IN','GET-TO','GET-OUT'):
-        veh, obj, place = params[1][2], params[0][1], params[2][2]
-        if (veh == params[2][1] == params[3][2]) and (obj == params[1][1] == params[3][1]):
-            g.add((states[0],'GET-TO', (obj, place)))
-    """
-    (:method (drive-to ?person ?veh ?loc)
+"""
+@_rule(_mid_handlers, ('GET-TO','STABILIZE','GET-IN','GET-TO','GET-OUT'))
+def _get_to_with_ambulance(states, params, g):
+    p0, p1, p2, p3, p4 = params
+    veh, obj, place = p0[0], p1[0], p3[1]
+    if (veh == p2[1] == p3[0] == p4[1]) and (obj == p2[0] == p4[0]):
+        g.add((states[0],'GET-TO', (obj, place)))
+
+# Missing get-to
+@_rule(_mid_handlers, ('STABILIZE','GET-IN','GET-TO','GET-OUT'))
+def _get_to_with_ambulance_no_get_to(states, params, g):
+    p0, p1, p2, p3 = params
+    veh, obj, place = p1[1], p0[0], p2[1]
+    if (veh == p2[0] == p3[1]) and (obj == p1[0] == p3[0]):
+        g.add((states[0],'GET-TO', (obj, place)))
+
+"""
+(:method (drive-to ?person ?veh ?loc)
 	   normal
 	   ((person ?person) (vehicle ?veh) (atloc ?veh ?vehloc)
 	    (atloc ?person ?vehloc) (can-drive ?person ?veh))
 	   ((!navegate-vehicle ?person ?veh ?loc)))
-    """
-    if tasknames == ('!NAVEGATE-VEHICLE',):
-        person, veh, loc = params[0][1], params[0][2], params[0][3]
-        g.add((states[0],'DRIVE-TO', (person, veh, loc)))
-    """
-    (:method (get-in ?obj ?veh)
+"""
+@_rule(_mid_handlers, ('!NAVEGATE-VEHICLE',))
+def _drive_to(states, params, g):
+    person, veh, loc = params[0][0], params[0][1], params[0][2]
+    g.add((states[0],'DRIVE-TO', (person, veh, loc)))
+
+"""
+(:method (get-in ?obj ?veh)
 	   ambulatory-person
 	   ((atloc ?obj ?objloc) (atloc ?veh ?objloc) 
 	    (person ?obj) (not (non-ambulatory ?obj)))
 	   (!climb-in ?obj ?veh)
-    """
-    if tasknames == ('!CLIMB-IN',):
-        obj, veh = params[0][1], params[0][2]
-        g.add((states[0],'GET-IN', (obj, veh)))
-    """
+"""
+@_rule(_mid_handlers, ('!CLIMB-IN',))
+def _get_in_ambulatory_person(states, params, g):
+    obj, veh = params[0][0], params[0][1]
+    g.add((states[0],'GET-IN', (obj, veh)))
+
+"""
 	   load-in
 	   ((atloc ?obj ?objloc) (atloc ?veh ?objloc)
 	    (person ?person) (can-lift ?person ?obj))
 	   ((get-to ?person ?objloc) (!load ?person ?obj ?veh)))
-    """
-    if tasknames == ('GET-TO', '!LOAD'):
-        obj, veh = params[1][2], params[1][3]
-        g.add((states[0],'GET-IN', (obj, veh)))
-    # Missing get-to
-    if tasknames == ('!LOAD',):
-        obj, veh = params[0][2], params[0][3]
-        g.add((states[0],'GET-IN', (obj, veh)))
-    """
-    (:method (get-out ?obj ?veh)
+"""
+@_rule(_mid_handlers, ('GET-TO', '!LOAD'))
+def _get_in_load_in(states, params, g):
+    obj, veh = params[1][1], params[1][2]
+    g.add((states[0],'GET-IN', (obj, veh)))
+
+# Missing get-to
+@_rule(_mid_handlers, ('!LOAD',))
+def _get_in_load_in_no_get_to(states, params, g):
+    obj, veh = params[0][1], params[0][2]
+    g.add((states[0],'GET-IN', (obj, veh)))
+
+"""
+(:method (get-out ?obj ?veh)
 	   ambulatory-person
 	   ((person ?obj) (not (non-ambulatory ?obj)))
 	   (!climb-out ?obj ?veh)
-    """
-    if tasknames == ('!CLIMB-OUT',):
-        obj, veh = params[0][1], params[0][2]
-        g.add((states[0],'GET-OUT', (obj, veh)))
-    """
+"""
+@_rule(_mid_handlers, ('!CLIMB-OUT',))
+def _get_out_ambulatory_person(states, params, g):
+    obj, veh = params[0][0], params[0][1]
+    g.add((states[0],'GET-OUT', (obj, veh)))
+
+"""
 	   unload
 	   ((atloc ?veh ?vehloc) (person ?person) (can-lift ?person ?obj))
 	   ((get-to ?person ?vehloc) (!unload ?person ?obj ?veh)))
-    """
-    if tasknames == ('GET-TO', '!UNLOAD'):
-        obj, veh = params[1][2], params[1][3]
-        g.add((states[0],'GET-OUT', (obj, veh)))
-    # Missing get-to
-    if tasknames == ('!UNLOAD',):
-        obj, veh = params[0][2], params[0][3]
-        g.add((states[0],'GET-OUT', (obj, veh)))
-    return g
+"""
+@_rule(_mid_handlers, ('GET-TO', '!UNLOAD'))
+def _get_out_unload(states, params, g):
+    obj, veh = params[1][1], params[1][2]
+    g.add((states[0],'GET-OUT', (obj, veh)))
 
-def top_causes(v):
-    """
-    Encodes all top-level causal relations in the knowledge base.
-    Inputs:
-        v: A sequence of tasks in the form (state, taskname, parameters)
-            Each state has the form (objects, facts)
-    Outputs:
-        g: The set of all possible causes of v, each also in the form (state, taskname, parameters).
-    """
-    states = tuple(s for (s,t,x) in v) # states (each of the form (objs, facts))
-    tasknames = tuple(t for (s,t,x) in v)
-    params = tuple((None,)+x for (s,t,x) in v) # Leading None for task name offset
-    g = set()
-    """
-    ;;set-up-shelter sets up a shelter at a certain location
-    (:method (set-up-shelter ?loc)
+# Missing get-to
+@_rule(_mid_handlers, ('!UNLOAD',))
+def _get_out_unload_no_get_to(states, params, g):
+    obj, veh = params[0][1], params[0][2]
+    g.add((states[0],'GET-OUT', (obj, veh)))
+
+"""
+;;set-up-shelter sets up a shelter at a certain location
+(:method (set-up-shelter ?loc)
 	   normal
 	   ((shelter-leader ?leader)
 	    (not (assigned-to-shelter ?leader ?other-shelter))
 	    (food ?food))
 	   ((get-electricity ?loc) (get-to ?leader ?loc) (get-to ?food ?loc)))
-    """
-    if tasknames == ('GET-ELECTRICITY','GET-TO','GET-TO'):
-        loc = params[0][1]
-        if loc == params[1][2] == params[2][2]:
-            if params[1][1] in sleaders and params[2][1] in food:
-                g.add((states[0],'SET-UP-SHELTER', (loc,)))
-    # Missing get-elecricity
-    if tasknames == ('GET-TO','GET-TO'):
-        loc = params[0][2]
-        if loc == params[1][2]:
-            if params[0][1] in sleaders and params[1][1] in food:
-                g.add((states[0],'SET-UP-SHELTER', (loc,)))
-    """
-    ;;fix-water-main
-    (:method (fix-water-main ?from ?to)
+"""
+@_rule(_top_handlers, ('GET-ELECTRICITY','GET-TO','GET-TO'))
+def _set_up_shelter(states, params, g):
+    loc = params[0][0]
+    if loc == params[1][1] == params[2][1]:
+        if params[1][0] in sleaders and params[2][0] in food:
+            g.add((states[0],'SET-UP-SHELTER', (loc,)))
+
+# Missing get-elecricity
+@_rule(_top_handlers, ('GET-TO','GET-TO'))
+def _set_up_shelter_no_get_electricity(states, params, g):
+    loc = params[0][1]
+    if loc == params[1][1]:
+        if params[0][0] in sleaders and params[1][0] in food:
+            g.add((states[0],'SET-UP-SHELTER', (loc,)))
+
+"""
+;;fix-water-main
+(:method (fix-water-main ?from ?to)
 	   normal
 	   ()
 	   ((shut-off-water ?from ?to) 
 	    (repair-pipe ?from ?to)
 	    (turn-on-water ?from ?to)))
-    """
-    if tasknames == ('SHUT-OFF-WATER','REPAIR-PIPE','TURN-ON-WATER'):
-        fromloc, toloc = params[0][1], params[0][2]
-        if (fromloc == params[1][1] == params[2][1]) and (toloc == params[1][2] == params[2][2]):
-            g.add((states[0],'FIX-WATER-MAIN', (fromloc, toloc)))
-    """
-    ;; clear-road-hazard - cleans up a hazardous spill
-    (:method (clear-road-hazard ?from ?to)
+"""
+@_rule(_top_handlers, ('SHUT-OFF-WATER','REPAIR-PIPE','TURN-ON-WATER'))
+def _fix_water_main(states, params, g):
+    fromloc, toloc = params[0][0], params[0][1]
+    if (fromloc == params[1][0] == params[2][0]) and (toloc == params[1][1] == params[2][1]):
+        g.add((states[0],'FIX-WATER-MAIN', (fromloc, toloc)))
+
+"""
+;; clear-road-hazard - cleans up a hazardous spill
+(:method (clear-road-hazard ?from ?to)
 	   normal
 	   ()
 	   ((block-road ?from ?to)
 	    (clean-up-hazard ?from ?to)
 	    (unblock-road ?from ?to)))
-    """
-    if tasknames == ('BLOCK-ROAD','CLEAN-UP-HAZARD','UNBLOCK-ROAD'):
-        fromloc, toloc = params[0][1], params[0][2]
-        if (fromloc == params[1][1] == params[2][1]) and (toloc == params[1][2] == params[2][2]):
-            g.add((states[0],'CLEAR-ROAD-HAZARD',(fromloc,toloc)))
-    """
-    ;; clear-road-wreck - gets a wreck out of the road
-    (:method (clear-road-wreck ?from ?to)
+"""
+@_rule(_top_handlers, ('BLOCK-ROAD','CLEAN-UP-HAZARD','UNBLOCK-ROAD'))
+def _clear_road_hazard(states, params, g):
+    fromloc, toloc = params[0][0], params[0][1]
+    if (fromloc == params[1][0] == params[2][0]) and (toloc == params[1][1] == params[2][1]):
+        g.add((states[0],'CLEAR-ROAD-HAZARD',(fromloc,toloc)))
+
+"""
+;; clear-road-wreck - gets a wreck out of the road
+(:method (clear-road-wreck ?from ?to)
 	   normal
 	   ()
 	   ((set-up-cones ?from ?to)
 	    (clear-wreck ?from ?to)
 	    (take-down-cones ?from ?to)))
-    """
-    if tasknames == ('SET-UP-CONES','CLEAR-WRECK','TAKE-DOWN-CONES'):
-        fromloc, toloc = params[0][1], params[0][2]
-        if (fromloc == params[1][1] == params[2][1]) and (toloc == params[1][2] == params[2][2]):
-            g.add((states[0],'CLEAR-ROAD-WRECK', (fromloc, toloc)))
-    """
-    ;; clear-road-tree
-    (:method (clear-road-tree ?from ?to) ;; clears a tree that's in the road
+"""
+@_rule(_top_handlers, ('SET-UP-CONES','CLEAR-WRECK','TAKE-DOWN-CONES'))
+def _clear_road_wreck(states, params, g):
+    fromloc, toloc = params[0][0], params[0][1]
+    if (fromloc == params[1][0] == params[2][0]) and (toloc == params[1][1] == params[2][1]):
+        g.add((states[0],'CLEAR-ROAD-WRECK', (fromloc, toloc)))
+
+"""
+;; clear-road-tree
+(:method (clear-road-tree ?from ?to) ;; clears a tree that's in the road
 	   normal
 	   ((tree-blocking-road ?from ?to ?tree))
 	   ((set-up-cones ?from ?to)
 	    (clear-tree ?tree)
 	    (take-down-cones ?from ?to)))
-    """
-    if tasknames == ('SET-UP-CONES','CLEAR-TREE','TAKE-DOWN-CONES'):
-        fromloc, toloc = params[0][1], params[0][2]
-        if (fromloc == params[2][1]) and (toloc == params[2][2]):
-            g.add((states[0],'CLEAR-ROAD-TREE', (fromloc, toloc)))
-    """
-    ;; plow-road
-    (:method (plow-road ?from ?to)
+"""
+@_rule(_top_handlers, ('SET-UP-CONES','CLEAR-TREE','TAKE-DOWN-CONES'))
+def _clear_road_tree(states, params, g):
+    fromloc, toloc = params[0][0], params[0][1]
+    if (fromloc == params[2][0]) and (toloc == params[2][1]):
+        g.add((states[0],'CLEAR-ROAD-TREE', (fromloc, toloc)))
+
+"""
+;; plow-road
+(:method (plow-road ?from ?to)
 	   plow
 	   ((road-snowy ?from ?to)
 	    (snowplow ?plow)
@@ -711,119 +905,195 @@ def top_causes(v):
 	    (!engage-plow ?driver ?plow)
 	    (!navegate-snowplow ?driver ?plow ?to)
 	    (!disengage-plow ?driver ?plow)))
-    """
-    if tasknames == ('GET-TO','!NAVEGATE-SNOWPLOW','!ENGAGE-PLOW','!NAVEGATE-SNOWPLOW','!DISENGAGE-PLOW'):
-        fromloc, toloc = params[1][3], params[3][3]
-        if params[0][1] == params[1][1] == params[2][1] == params[3][1] == params[4][1]:
-            g.add((states[0],'PLOW-ROAD',(fromloc,toloc)))
-    # Missing get-to:
-    if tasknames == ('!NAVEGATE-SNOWPLOW','!ENGAGE-PLOW','!NAVEGATE-SNOWPLOW','!DISENGAGE-PLOW'):
-        fromloc, toloc = params[0][3], params[2][3]
-        if params[0][1] == params[1][1] == params[2][1] == params[3][1]:
-            g.add((states[0],'PLOW-ROAD',(fromloc,toloc)))
-    """
-    ;;quell-riot
-    (:method (quell-riot ?loc)
+"""
+@_rule(_top_handlers, ('GET-TO','!NAVEGATE-SNOWPLOW','!ENGAGE-PLOW','!NAVEGATE-SNOWPLOW','!DISENGAGE-PLOW'))
+def _plow_road(states, params, g):
+    p0, p1, p2, p3, p4 = params
+    fromloc, toloc = p1[2], p3[2]
+    if p0[0] == p1[0] == p2[0] == p3[0] == p4[0]:
+        g.add((states[0],'PLOW-ROAD',(fromloc,toloc)))
+
+# Missing get-to:
+@_rule(_top_handlers, ('!NAVEGATE-SNOWPLOW','!ENGAGE-PLOW','!NAVEGATE-SNOWPLOW','!DISENGAGE-PLOW'))
+def _plow_road_no_get_to(states, params, g):
+    p0, p1, p2, p3 = params
+    fromloc, toloc = p0[2], p2[2]
+    if p0[0] == p1[0] == p2[0] == p3[0]:
+        g.add((states[0],'PLOW-ROAD',(fromloc,toloc)))
+
+"""
+;;quell-riot
+(:method (quell-riot ?loc)
 	   with-police
 	   ((in-town ?loc ?town)
 	    (police-unit ?p1) (police-unit ?p2) (not (equal ?p1 ?p2)))
 	   ((declare-curfew ?town) (get-to ?p1 ?loc) (get-to ?p2 ?loc)
 	    (!set-up-barricades ?p1) (!set-up-barricades ?p2)))
-    """
-    if tasknames == ('DECLARE-CURFEW','GET-TO','GET-TO','!SET-UP-BARRICADES','!SET-UP-BARRICADES'):
-        loc = params[1][2]
-        if loc == params[2][2]:
-            g.add((states[0],'QUELL-RIOT',(loc,)))
-    # Missing get-to
-    if tasknames == ('DECLARE-CURFEW','GET-TO','!SET-UP-BARRICADES','!SET-UP-BARRICADES',):
-        loc = params[1][2]
+"""
+@_rule(_top_handlers, ('DECLARE-CURFEW','GET-TO','GET-TO','!SET-UP-BARRICADES','!SET-UP-BARRICADES'))
+def _quell_riot(states, params, g):
+    loc = params[1][1]
+    if loc == params[2][1]:
         g.add((states[0],'QUELL-RIOT',(loc,)))
-    if tasknames == ('DECLARE-CURFEW','!SET-UP-BARRICADES','!SET-UP-BARRICADES',):
-        p2 = params[2][1]
-        m = unify(states[2][1], ('ATLOC', p2, None))
-        if len(m) == 1:
+
+# Missing get-to
+@_rule(_top_handlers, ('DECLARE-CURFEW','GET-TO','!SET-UP-BARRICADES','!SET-UP-BARRICADES'))
+def _quell_riot_no_second_get_to(states, params, g):
+    loc = params[1][1]
+    g.add((states[0],'QUELL-RIOT',(loc,)))
+
+@_rule(_top_handlers, ('DECLARE-CURFEW','!SET-UP-BARRICADES','!SET-UP-BARRICADES'))
+def _quell_riot_no_get_to(states, params, g):
+    state = states[0]
+    p2 = params[2][0]
+    m = indexed_unify(states[2][1], ('ATLOC', p2, None))
+    if len(m) == 1:
+        loc = m.pop()[0]
+        g.add((state,'QUELL-RIOT',(loc,)))
+    else:
+        p1 = params[1][0]
+        m = indexed_unify(states[1][1], ('ATLOC', p1, None))
+        if len(m)==1:
             loc = m.pop()[0]
-            g.add((states[0],'QUELL-RIOT',(loc,)))
+            g.add((state,'QUELL-RIOT',(loc,)))
         else:
-            p1 = params[1][1]
-            m = unify(states[1][1], ('ATLOC', p1, None))
-            if len(m)==1:
-                loc = m.pop()[0]
-                g.add((states[0],'QUELL-RIOT',(loc,)))
-            else:
-                for loc in poslocs:
-                    g.add((states[0],'QUELL-RIOT',(loc,)))
-    """
-    ;;provide-temp-heat
-    (:method (provide-temp-heat ?person)
+            g.update((state,'QUELL-RIOT',(loc,)) for loc in poslocs)
+
+"""
+;;provide-temp-heat
+(:method (provide-temp-heat ?person)
 	   to-shelter
 	   ((person ?person) (shelter ?shelter))
 	   ((get-to ?person ?shelter)))
-    """
-    if tasknames == ('GET-TO',):
-        person = params[0][1]
-        if len(person) >= 6 and person[:6]=='PERSON':
-            g.add((states[0],'PROVIDE-TEMP-HEAT',(person,)))
-    """
-    (:method (provide-temp-heat ?person)
+"""
+@_rule(_top_handlers, ('GET-TO',))
+def _provide_temp_heat_to_shelter(states, params, g):
+    person = params[0][0]
+    if person.startswith('PERSON'):
+        g.add((states[0],'PROVIDE-TEMP-HEAT',(person,)))
+
+"""
+(:method (provide-temp-heat ?person)
 	   local-electricity
 	   ((person ?person) (atloc ?person ?ploc))
 	   ((generate-temp-electricity ?ploc) (!turn-on-heat ?ploc)))
-    """
-    if tasknames == ('GENERATE-TEMP-ELECTRICITY','!TURN-ON-HEAT'):
-        for obj in states[0][0]:
-            if len(obj) >= 6 and obj[:6] == 'PERSON':
-                g.add((states[0],'PROVIDE-TEMP-HEAT',(obj,)))
-    """
-    ;;fix-power-line
-    (:method (fix-power-line ?lineloc)
+"""
+@_rule(_top_handlers, ('GENERATE-TEMP-ELECTRICITY','!TURN-ON-HEAT'))
+def _provide_temp_heat_local_electricity(states, params, g):
+    state = states[0]
+    _, persons = _state_objects(state[0])
+    g.update((state,'PROVIDE-TEMP-HEAT',(obj,)) for obj in persons)
+
+"""
+;;fix-power-line
+(:method (fix-power-line ?lineloc)
 	   normal
 	   ((power-crew ?crew) (power-van ?van))
 	   ((get-to ?crew ?lineloc) (get-to ?van ?lineloc)
 	    (repair-line ?crew ?lineloc)))
-    """
-    if tasknames == ('GET-TO','GET-TO','REPAIR-LINE'):
-        lineloc = params[2][2] # params[0][2] need not be lineloc, monroe bug?
-        if lineloc == params[1][2] and params[0][1]==params[2][1]:
-            if params[0][1] in pcrews:
-                g.add((states[0],'FIX-POWER-LINE', (lineloc,)))
-    # Missing get-to
-    if tasknames in [('GET-TO','REPAIR-LINE'),('REPAIR-LINE',)]:
-        lineloc = params[-1][2]
-        if lineloc == params[0][2]:
+"""
+@_rule(_top_handlers, ('GET-TO','GET-TO','REPAIR-LINE'))
+def _fix_power_line(states, params, g):
+    lineloc = params[2][1] # params[0][1] need not be lineloc, monroe bug?
+    if lineloc == params[1][1] and params[0][0]==params[2][0]:
+        if params[0][0] in pcrews:
             g.add((states[0],'FIX-POWER-LINE', (lineloc,)))
-    """
-    ;;provide-medical-attention
-    (:method (provide-medical-attention ?person)
+
+# Missing get-to
+@_rule(_top_handlers, ('GET-TO','REPAIR-LINE'),('REPAIR-LINE',))
+def _fix_power_line_no_get_to(states, params, g):
+    lineloc = params[-1][1]
+    if lineloc == params[0][1]:
+        g.add((states[0],'FIX-POWER-LINE', (lineloc,)))
+
+"""
+;;provide-medical-attention
+(:method (provide-medical-attention ?person)
 	   in-hospital
 	   ((hospital ?hosp) (has-condition ?person ?cond)
 	    (not (hospital-doesnt-treat ?hosp ?cond)))
 	   ((get-to ?person ?hosp) (!treat-in-hospital ?person ?hosp)))
-    """
-    if tasknames == ('GET-TO','!TREAT-IN-HOSPITAL'):
-        person = params[0][1]
-        if (person == params[1][1]):
-            g.add((states[0],'PROVIDE-MEDICAL-ATTENTION', (person,)))
-    # Missing get-to
-    if tasknames == ('!TREAT-IN-HOSPITAL',):
-        person = params[0][1]
+"""
+@_rule(_top_handlers, ('GET-TO','!TREAT-IN-HOSPITAL'))
+def _provide_medical_attention_in_hospital(states, params, g):
+    person = params[0][0]
+    if (person == params[1][0]):
         g.add((states[0],'PROVIDE-MEDICAL-ATTENTION', (person,)))
-    """
-    (:method (provide-medical-attention ?person)
+
+# Missing get-to
+@_rule(_top_handlers, ('!TREAT-IN-HOSPITAL',))
+def _provide_medical_attention_no_get_to(states, params, g):
+    person = params[0][0]
+    g.add((states[0],'PROVIDE-MEDICAL-ATTENTION', (person,)))
+
+"""
+(:method (provide-medical-attention ?person)
 	   simple-on-site
 	   ((has-condition ?person ?cond) (not (serious-condition ?cond)))
 	   ((emt-treat ?person)))
+"""
+@_rule(_top_handlers, ('EMT-TREAT',))
+def _provide_medical_attention_simple_on_site(states, params, g):
+    person = params[0][0]
+    g.add((states[0],'PROVIDE-MEDICAL-ATTENTION', (person,)))
+
+def _dispatch(v, tables):
     """
-    if tasknames == ('EMT-TREAT',):
-        person = params[0][1]
-        g.add((states[0],'PROVIDE-MEDICAL-ATTENTION', (person,)))
-    return g
+    Run the handlers that match v in each of the given dispatch tables.
+    Inputs:
+        v: A sequence of tasks in the form (state, taskname, parameters)
+            Each state has the form (objects, facts)
+        tables: tuple of dispatch tables (_mid_handlers and/or _top_handlers)
+    Outputs:
+        g: The frozenset of all possible causes of v, each also in the form (state, taskname, parameters).
+    """
+    if len(v) > M: return frozenset()
+    patterns = [table[len(v)][v[0][1]] for table in tables if v[0][1] in table[len(v)]]
+    if len(patterns) == 0: return frozenset()
+    # states (each of the form (objs, facts)), task names, and parameter lists, in one pass over v
+    states, tasknames, params = zip(*v)
+    g = set()
+    for table_patterns in patterns:
+        for handler in table_patterns.get(tasknames, ()):
+            handler(states, params, g)
+    return frozenset(g)
 
-def causes(v):
+@functools.lru_cache(maxsize=200000)
+def causes(v, include_top=True):
     """
     Full causal relation (both mid- and top-level)
+    Inputs:
+        v: A sequence of tasks in the form (state, taskname, parameters)
+            Each state has the form (objects, facts)
+        include_top: if False, top-level causes are omitted (as in the modified Monroe experiments)
+    Outputs:
+        g: The frozenset of all possible causes of v, each also in the form (state, taskname, parameters).
+    Results are memoized, since the parser asks for the causes of the same v many times.
+    """
+    return _dispatch(v, (_mid_handlers, _top_handlers) if include_top else (_mid_handlers,))
+
+def mid_causes(v):
+    """
+    Encodes all mid-level causal relations in the knowledge base.
+    Same as causes(v, include_top=False).
+    """
+    return causes(v, include_top=False)
+
+@functools.lru_cache(maxsize=200000)
+def top_causes(v):
+    """
+    Encodes all top-level causal relations in the knowledge base.
+    Outputs are in the same form as causes, and are memoized likewise.
+    """
+    return _dispatch(v, (_top_handlers,))
+
+def clear_caches():
+    """
+    Clear the memoized causes, and the memoized helpers and unifications they use.
+    Memos are rarely shared between different plans, so this should be called after each plan to bound memory.
     """
-    return top_causes(v) | mid_causes(v)
+    for cached in (causes, top_causes, _state_objects, _all_pairs_causes, single_unify, index_facts):
+        cached.cache_clear()
 
 def main():
     pass
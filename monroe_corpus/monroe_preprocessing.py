@@ -4,8 +4,38 @@ Preprocessing of the Monroe Plan Corpus for copct:
 - Extracts intermediate states for every plan in the corpus
 - Reformats intentions into (state, task, parameters) form
 """
-from monroe_static import locs, watercos, powercos, poslocs, sleaders, gens, food, pcrews
-from monroe_utils import unify, single_unify
+import functools
+import multiprocessing
+import re
+try:
+    from .monroe_static import locs, watercos, powercos
+    from .monroe_utils import single_unify
+except ImportError: # run as a script from within monroe_corpus
+    from monroe_static import locs, watercos, powercos
+    from monroe_utils import single_unify
+
+# objects always present in every plan of the corpus, omitted by extract_objects
+_static_objects = frozenset(locs) | frozenset(watercos) | frozenset(powercos)
+
+# canonical copies of every fact seen so far, so equal facts are shared and hash/compare by pointer
+_fact_pool = {}
+
+def _intern(fact):
+    """
+    Return the canonical copy of a fact tuple from _fact_pool.
+    Inputs:
+        fact: a grounded relation of the form (name, arg1, arg2, ...)
+    Outputs:
+        fact: the pooled tuple equal to the input
+    """
+    return _fact_pool.setdefault(fact, fact)
+
+@functools.lru_cache(maxsize=None)
+def _singleton(fact):
+    """
+    Return a cached frozenset containing only the interned fact.
+    """
+    return frozenset((_intern(fact),))
 
 def parse_monroe(infilename='monroe5000.txt', outfilename='monroe5000.py'):
     """
@@ -15,215 +45,249 @@ def parse_monroe(infilename='monroe5000.txt', outfilename='monroe5000.py'):
         infilename: filename from which the lisp data is read
         outfilename: filename to which the python script is written
     """
-    infile = open(infilename,"r")
-    outfile = open(outfilename,"w")
-    outfile.write("corpus = (\n")
-    syntax_chars = "() \t\n" # lisp syntax
-    previous_char = " "
-    for line in infile:
-        for char in line:
-            if (previous_char in syntax_chars) != (char in syntax_chars):
-                # just changed between syntax and symbol, quote symbol for python
-                outfile.write("\"")
-                # separate symbols with commas for python
-                if char in syntax_chars: outfile.write(",")
-            # separate sub-lists with commas for python
-            if previous_char == ")": outfile.write(",")
-            # write current character and advance
-            outfile.write(char)
-            previous_char = char
-    outfile.write(")")
-    infile.close()
-    outfile.close()
-
-def populate_states_from_op(pre_states, op):
+    with open(infilename,"r") as infile:
+        lisp = infile.read()
+    # quote each symbol for python, followed by a comma to separate it from the next
+    pydata = re.sub(r'([^() \t\n]+)(?=[() \t\n])', r'"\1",', lisp)
+    # separate sub-lists with commas for python
+    pydata = re.sub(r'\)(?=.)', '),', pydata, flags=re.DOTALL)
+    with open(outfilename,"w") as outfile:
+        outfile.write("corpus = (\n")
+        outfile.write(pydata)
+        outfile.write(")")
+
+# maps each task name to the function that populates states for that operator
+_handlers = {}
+
+def _handles(task):
+    """
+    Decorator that registers a function in _handlers for the given task name.
+    """
+    def register(handler):
+        _handlers[task] = handler
+        return handler
+    return register
+
+def _no_information(pre_states, op, type_facts):
+    """
+    Handler for methods that add no facts beyond those already inferred from their subtasks.
+    """
+    return pre_states
+
+def _add_type_facts(type_facts, facts, pre_states):
+    """
+    Record facts in type_facts as holding in every leading state but the last.
+    The last leading state is left without them, as when they were added to each state directly.
+    """
+    n = len(pre_states)-1
+    for fact in facts:
+        if type_facts.get(fact, 0) < n: type_facts[fact] = n
+
+def _primitive(pre_states, op, type_facts):
+    """
+    Handler for the remaining operators (all primitive, empty preconds/adds/deletes).
+    """
+    pre_states.append(pre_states[-1])
+    return pre_states
+
+def _apply(pre_states, atloc_params, pre_add=frozenset(), post_add=frozenset(), post_del=frozenset(),
+    bound_pre=(), bound_post_add=(), bound_post_del=()):
+    """
+    Shared body of the primitive operator handlers.
+    Adds facts to the last leading state and appends the state resulting from the operator.
+    Inputs:
+        pre_states: the states leading up to the application of the operator, as in populate_states_from_op
+        atloc_params: parameters whose common location loc is found with single_unify on ('ATLOC', param, None)
+        pre_add: facts added to the last leading state
+        post_add, post_del: facts added to and deleted from the resulting state
+        bound_pre, bound_post_add, bound_post_del: parameters whose ('ATLOC', param, loc) facts are added to the last leading state,
+            added to the resulting state, and deleted from the resulting state, when loc is found
+    Outputs:
+        states: pre_states with the last state updated and the resulting state appended
+    """
+    objs, facts = pre_states[-1]
+    facts = facts | pre_add
+    post_facts = (facts | post_add) - post_del
+    loc, = single_unify(facts, *(('ATLOC', param, None) for param in atloc_params))
+    if loc is not None:
+        facts = facts | {_intern(('ATLOC', param, loc)) for param in bound_pre}
+        post_facts = post_facts | {_intern(('ATLOC', param, loc)) for param in bound_post_add}
+        post_facts = post_facts - {('ATLOC', param, loc) for param in bound_post_del}
+    pre_states[-1] = (objs, facts)
+    pre_states.append((objs, post_facts))
+    return pre_states
+
+def populate_states_from_op(pre_states, op, type_facts):
     """
     Infers additional facts that must have been true in the previous states for the op to be applied successfully.
     Returns the states with the additional facts added.
-    This implementation has a separate case for every operator in the Monroe domain.
+    pre_states is updated in place (rather than copied for every operator) and returned.
+    This implementation has a separate handler in _handlers for every operator in the Monroe domain.
     Inputs:
         op: a grounded operator of the form (name, arg1, arg2, ...)
         pre_states: the states leading up to the application of the operator.
             pre_states[i] is the i^{th} state, of the form (objs, facts).
-            objs is a list of possible parameter values, facts is a list of relations over those objects.
+            objs is a list of possible parameter values, facts is a frozenset of relations over those objects.
+        type_facts: a dict mapping type facts (person, vehicle, fit-in) to the number of leading states they hold in.
+            Facts inferred from op that hold in a prefix of the states are recorded here instead of added to each of pre_states.
     Outputs:
         states[i]: the states with additional facts added.
         if op is a primitive action, the last element is a new state after op was applied.
     """
-    objs = pre_states[-1][0]
-    # facts true before and after operator is applied (may be altered)
-    pre_facts = set(pre_states[-1][1])
-    task = op[0]
-    """
-    (:operator (!navegate-vehicle ?person ?veh ?loc)
+    return _handlers.get(op[0], _primitive)(pre_states, op, type_facts)
+
+"""
+(:operator (!navegate-vehicle ?person ?veh ?loc)
 	     ((person ?person) (vehicle ?veh) (atloc ?veh ?vehloc)
 	      (atloc ?person ?vehloc) (can-drive ?person ?veh)
 	      (not (wrecked-car ?veh)))
 	     ((atloc ?veh ?vehloc) (atloc ?person ?vehloc))
 	     ((atloc ?veh ?loc) (atloc ?person ?loc)))
-    """
-    if task == '!NAVEGATE-VEHICLE':
-        person, veh, loc = op[1:]
-        for s in range(len(pre_states)):
-            pre_states[s] = (objs, tuple(set(pre_states[s][1]) | set((('PERSON', person), ('VEHICLE', veh)))))
-        post_facts = pre_facts | set((('ATLOC', veh, loc), ('ATLOC', person, loc)))
-        vehloc, = single_unify(pre_facts, ('ATLOC', veh, None), ('ATLOC', person, None))
-        if vehloc is not None:
-            pre_facts |= set((('ATLOC', veh, vehloc), ('ATLOC', person, vehloc)))
-            post_facts -= set((('ATLOC', veh, vehloc), ('ATLOC', person, vehloc)))
-        pre_states[-1] = (objs, tuple(pre_facts))
-        post_state = (objs, tuple(post_facts))
-        return pre_states + [post_state]
-    """
-    (:operator (!climb-in ?obj ?veh) 
+"""
+@_handles('!NAVEGATE-VEHICLE')
+def _navegate_vehicle(pre_states, op, type_facts):
+    _, person, veh, loc = op
+    _add_type_facts(type_facts, (_intern(('PERSON', person)), _intern(('VEHICLE', veh))), pre_states)
+    return _apply(pre_states, (veh, person),
+        post_add={_intern(('ATLOC', veh, loc)), _intern(('ATLOC', person, loc))},
+        bound_pre=(veh, person), bound_post_del=(veh, person))
+
+"""
+(:operator (!climb-in ?obj ?veh) 
 	     ((atloc ?obj ?objloc) (atloc ?veh ?objloc) (fit-in ?obj ?veh))
 	     ((atloc ?obj ?objloc))
 	     ((atloc ?obj ?veh)))
-    """
-    if task == '!CLIMB-IN':
-        obj, veh = op[1:]
-        post_facts = pre_facts | set((('ATLOC', obj, veh),))
-        objloc, = single_unify(pre_facts, ('ATLOC', obj, None), ('ATLOC', veh, None))
-        if objloc is not None:
-            pre_facts.add(('ATLOC', obj, objloc))
-            post_facts.discard(('ATLOC', obj, objloc))
-        pre_states[-1] = (objs, tuple(pre_facts))
-        post_state = (objs, tuple(post_facts))
-        return pre_states + [post_state]
-    """
-    (:operator (!climb-out ?obj ?veh) 
+"""
+@_handles('!CLIMB-IN')
+def _climb_in(pre_states, op, type_facts):
+    _, obj, veh = op
+    return _apply(pre_states, (obj, veh), post_add=_singleton(('ATLOC', obj, veh)),
+        bound_pre=(obj,), bound_post_del=(obj,))
+
+"""
+(:operator (!climb-out ?obj ?veh) 
 	     ((atloc ?obj ?veh) (atloc ?veh ?vehloc)) 
 	     ((atloc ?obj ?veh)) 
 	     ((atloc ?obj ?vehloc)))
-    """
-    if task == '!CLIMB-OUT':
-        obj, veh = op[1:]
-        pre_facts.add(('ATLOC', obj, veh))
-        post_facts = pre_facts - set((('ATLOC', obj, veh),))
-        vehloc, = single_unify(pre_facts, ('ATLOC', veh, None))
-        if vehloc is not None:
-            post_facts.add(('ATLOC', obj, vehloc))
-        pre_states[-1] = (objs, tuple(pre_facts))
-        post_state = (objs, tuple(post_facts))
-        return pre_states + [post_state]
-    """
-    (:operator (!load ?person ?obj ?veh) 
+"""
+@_handles('!CLIMB-OUT')
+def _climb_out(pre_states, op, type_facts):
+    _, obj, veh = op
+    return _apply(pre_states, (veh,),
+        pre_add=_singleton(('ATLOC', obj, veh)), post_del=_singleton(('ATLOC', obj, veh)),
+        bound_post_add=(obj,))
+
+"""
+(:operator (!load ?person ?obj ?veh) 
 	     ((atloc ?obj ?objloc) 
 	      (atloc ?veh ?objloc) 
 	      (atloc ?person ?objloc)
 	      (fit-in ?obj ?veh))
 	     ((atloc ?obj ?objloc))
 	     ((atloc ?obj ?veh)))
-    """
-    if task == '!LOAD':
-        person, obj, veh = op[1:]
-        for s in range(len(pre_states)):
-            pre_states[s] = (objs, tuple(set(pre_states[s][1]) | set((('FIT-IN', obj, veh),))))
-        post_facts = set(pre_facts) | set((('ATLOC', obj, veh),))
-        objloc, = single_unify(pre_facts, *[('ATLOC', param, None) for param in op[1:]])
-        if objloc is not None:
-            pre_facts |= set(tuple(('ATLOC', param, objloc) for param in op[1:]))
-            post_facts.discard(('ATLOC', obj, objloc))
-        pre_states[-1] = (objs, tuple(pre_facts))
-        post_state = (objs, tuple(post_facts))
-        return pre_states + [post_state]
-    """
-    (:operator (!unload ?person ?obj ?veh) 
+"""
+@_handles('!LOAD')
+def _load(pre_states, op, type_facts):
+    _, person, obj, veh = op
+    _add_type_facts(type_facts, (_intern(('FIT-IN', obj, veh)),), pre_states)
+    return _apply(pre_states, (person, obj, veh), post_add=_singleton(('ATLOC', obj, veh)),
+        bound_pre=(person, obj, veh), bound_post_del=(obj,))
+
+"""
+(:operator (!unload ?person ?obj ?veh) 
 	     ((atloc ?obj ?veh) (atloc ?veh ?vehloc) (atloc ?person ?vehloc)) 
 	     ((atloc ?obj ?veh))
 	     ((atloc ?obj ?vehloc)))
-    """
-    if task == '!UNLOAD':
-        person, obj, veh = op[1:]
-        pre_facts |= set((('ATLOC', obj, veh),))
-        post_facts = set(pre_facts) - set((('ATLOC', obj, veh),))
-        vehloc, = single_unify(pre_facts, *[('ATLOC', param, None) for param in [veh, person]])
-        if vehloc is not None:
-            pre_facts |= set(tuple(('ATLOC', param, vehloc) for param in [veh, person]))
-            post_facts.add(('ATLOC', obj, vehloc))
-        pre_states[-1] = (objs, tuple(pre_facts))
-        post_state = (objs, tuple(post_facts))
-        return pre_states + [post_state]
-    """
-    (:operator (!treat ?emt ?person) 
+"""
+@_handles('!UNLOAD')
+def _unload(pre_states, op, type_facts):
+    _, person, obj, veh = op
+    return _apply(pre_states, (veh, person),
+        pre_add=_singleton(('ATLOC', obj, veh)), post_del=_singleton(('ATLOC', obj, veh)),
+        bound_pre=(veh, person), bound_post_add=(obj,))
+
+"""
+(:operator (!treat ?emt ?person) 
 	     ((atloc ?person ?ploc) (atloc ?emt ?ploc))
 	     ()
 	     ())
-    """
-    if task == '!TREAT':
-        emt, person = op[1:]
-        ploc, = single_unify(pre_facts, *[('ATLOC', param, None) for param in [emt, person]])
-        if ploc is not None:
-            pre_facts |= set(tuple(('ATLOC', param, ploc) for param in [emt, person]))
-        post_facts = set(pre_facts)
-        pre_states[-1] = (objs, tuple(pre_facts))
-        post_state = (objs, tuple(post_facts))
-        return pre_states + [post_state]
-    """
-    (:operator (!treat-in-hospital ?person ?hospital) 
+"""
+@_handles('!TREAT')
+def _treat(pre_states, op, type_facts):
+    _, emt, person = op
+    return _apply(pre_states, (emt, person), bound_pre=(emt, person), bound_post_add=(emt, person))
+
+"""
+(:operator (!treat-in-hospital ?person ?hospital) 
 	     ((atloc ?person ?hospital))
 	     ()
 	     ())
-    """
-    if task == 'TREAT-IN-HOSPITAL':
-        pre_facts |= set((('ATLOC', op[1], op[2]),))
-        post_facts = set(pre_facts)
-        pre_states[-1] = (objs, tuple(pre_facts))
-        post_state = (objs, tuple(post_facts))
-        return pre_states + [post_state]
-    """
-    ;;set-up-shelter sets up a shelter at a certain location
-    (:method (set-up-shelter ?loc)
+"""
+@_handles('TREAT-IN-HOSPITAL')
+def _treat_in_hospital(pre_states, op, type_facts):
+    objs, facts = pre_states[-1]
+    pre_states[-1] = post_state = (objs, facts | _singleton(('ATLOC', op[1], op[2])))
+    pre_states.append(post_state)
+    return pre_states
+
+"""
+;;set-up-shelter sets up a shelter at a certain location
+(:method (set-up-shelter ?loc)
 	   normal
 	   ((shelter-leader ?leader)
 	    (not (assigned-to-shelter ?leader ?other-shelter))
 	    (food ?food))
 	   ((get-electricity ?loc) (get-to ?leader ?loc) (get-to ?food ?loc)))
-    """
-    if task == 'SET-UP-SHELTER': return pre_states # could do better with tree?
-    """
-    ;;fix-water-main
-    (:method (fix-water-main ?from ?to)
+"""
+_handlers['SET-UP-SHELTER'] = _no_information # could do better with tree?
+
+"""
+;;fix-water-main
+(:method (fix-water-main ?from ?to)
 	   normal
 	   ()
 	   ((shut-off-water ?from ?to) 
 	    (repair-pipe ?from ?to)
 	    (turn-on-water ?from ?to)))
-    """
-    if task == 'FIX-WATER-MAIN': return pre_states # no information
-    """
-    ;; clear-road-hazard - cleans up a hazardous spill
-    (:method (clear-road-hazard ?from ?to)
+"""
+_handlers['FIX-WATER-MAIN'] = _no_information # no information
+
+"""
+;; clear-road-hazard - cleans up a hazardous spill
+(:method (clear-road-hazard ?from ?to)
 	   normal
 	   ()
 	   ((block-road ?from ?to)
 	    (clean-up-hazard ?from ?to)
 	    (unblock-road ?from ?to)))
-    """
-    if task == 'CLEAR-ROAD-HAZARD': return pre_states # no information
-    """
-    ;; clear-road-wreck - gets a wreck out of the road
-    (:method (clear-road-wreck ?from ?to)
+"""
+_handlers['CLEAR-ROAD-HAZARD'] = _no_information # no information
+
+"""
+;; clear-road-wreck - gets a wreck out of the road
+(:method (clear-road-wreck ?from ?to)
 	   normal
 	   ()
 	   ((set-up-cones ?from ?to)
 	    (clear-wreck ?from ?to)
 	    (take-down-cones ?from ?to)))
-    """
-    if task == 'CLEAR-ROAD-WRECK': return pre_states # no information
-    """
-    ;; clear-road-tree
-    (:method (clear-road-tree ?from ?to) ;; clears a tree that's in the road
+"""
+_handlers['CLEAR-ROAD-WRECK'] = _no_information # no information
+
+"""
+;; clear-road-tree
+(:method (clear-road-tree ?from ?to) ;; clears a tree that's in the road
 	   normal
 	   ((tree-blocking-road ?from ?to ?tree))
 	   ((set-up-cones ?from ?to)
 	    (clear-tree ?tree)
 	    (take-down-cones ?from ?to)))
-    """
-    if task == 'CLEAR-ROAD-TREE': return pre_states # no information not already in subs
-    """
-    ;; plow-road
-    (:method (plow-road ?from ?to)
+"""
+_handlers['CLEAR-ROAD-TREE'] = _no_information # no information not already in subs
+
+"""
+;; plow-road
+(:method (plow-road ?from ?to)
 	   plow
 	   ((road-snowy ?from ?to)
 	    (snowplow ?plow)
@@ -236,100 +300,111 @@ def populate_states_from_op(pre_states, op):
 	    (!engage-plow ?driver ?plow)
 	    (!navegate-snowplow ?driver ?plow ?to)
 	    (!disengage-plow ?driver ?plow)))
-    """
-    if task == 'PLOW-ROAD': return pre_states # road-snowy worth it?
-    """
-    ;;quell-riot
-    (:method (quell-riot ?loc)
+"""
+_handlers['PLOW-ROAD'] = _no_information # road-snowy worth it?
+
+"""
+;;quell-riot
+(:method (quell-riot ?loc)
 	   with-police
 	   ((in-town ?loc ?town)
 	    (police-unit ?p1) (police-unit ?p2) (not (equal ?p1 ?p2)))
 	   ((declare-curfew ?town) (get-to ?p1 ?loc) (get-to ?p2 ?loc)
 	    (!set-up-barricades ?p1) (!set-up-barricades ?p2)))
-    """
-    if task == 'QUELL-RIOT': return pre_states #
-    """
-    ;;provide-temp-heat
-    (:method (provide-temp-heat ?person)
+"""
+_handlers['QUELL-RIOT'] = _no_information
+
+"""
+;;provide-temp-heat
+(:method (provide-temp-heat ?person)
 	   to-shelter
 	   ((person ?person) (shelter ?shelter))
 	   ((get-to ?person ?shelter)))
-    (:method (provide-temp-heat ?person)
+(:method (provide-temp-heat ?person)
 	   local-electricity
 	   ((person ?person) (atloc ?person ?ploc))
 	   ((generate-temp-electricity ?ploc) (!turn-on-heat ?ploc)))
-    """
-    if task == 'PROVIDE-TEMP-HEAT': return pre_states #
-    """
-    ;;fix-power-line
-    (:method (fix-power-line ?lineloc)
+"""
+_handlers['PROVIDE-TEMP-HEAT'] = _no_information
+
+"""
+;;fix-power-line
+(:method (fix-power-line ?lineloc)
 	   normal
 	   ((power-crew ?crew) (power-van ?van))
 	   ((get-to ?crew ?lineloc) (get-to ?van ?lineloc)
 	    (repair-line ?crew ?lineloc)))
-    """
-    if task == 'FIX-POWER-LINE': return pre_states #
-    """
-    ;;provide-medical-attention
-    (:method (provide-medical-attention ?person)
+"""
+_handlers['FIX-POWER-LINE'] = _no_information
+
+"""
+;;provide-medical-attention
+(:method (provide-medical-attention ?person)
 	   in-hospital
 	   ((hospital ?hosp) (has-condition ?person ?cond)
 	    (not (hospital-doesnt-treat ?hosp ?cond)))
 	   ((get-to ?person ?hosp) (!treat-in-hospital ?person ?hosp)))
-    (:method (provide-medical-attention ?person)
+(:method (provide-medical-attention ?person)
 	   simple-on-site
 	   ((has-condition ?person ?cond) (not (serious-condition ?cond)))
 	   ((emt-treat ?person)))
-    """
-    if task == 'PROVIDE-MEDICAL-ATTENTION': return pre_states
-    """
-    ;;;;;;;;;;;;;;;;;;; subgoals ;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
-    ;; clean-up-hazard
-    (:method (clean-up-hazard ?from ?to)
+"""
+_handlers['PROVIDE-MEDICAL-ATTENTION'] = _no_information
+
+"""
+;;;;;;;;;;;;;;;;;;; subgoals ;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
+;; clean-up-hazard
+(:method (clean-up-hazard ?from ?to)
 	   very-hazardous ;; just call the feds
 	   ((hazard-seriousness ?from ?to very-hazardous))
 	   ((!call fema))
 	   normal ;; we can take care of it
 	   ((hazard-team ?ht))
 	   ((get-to ?ht ?from) (!clean-hazard ?ht ?from ?to)))
-    """
-    if task == 'CLEAN-UP-HAZARD':
-        # kludge: should only add if child is call fema (needs tree not just op)
-        fromloc, toloc = op[1:]
-        pre_states[-1] = (objs, tuple(set(pre_states[-1][1]) | set((('HAZARD-SERIOUSNESS', fromloc, toloc, 'VERY-HAZARDOUS'),))))
-        return pre_states
-    """
-    ;; block-road - blocks off a road
-    (:method (block-road ?from ?to)
+"""
+@_handles('CLEAN-UP-HAZARD')
+def _clean_up_hazard(pre_states, op, type_facts):
+    objs = pre_states[-1][0]
+    # kludge: should only add if child is call fema (needs tree not just op)
+    _, fromloc, toloc = op
+    pre_states[-1] = (objs, pre_states[-1][1] | _singleton(('HAZARD-SERIOUSNESS', fromloc, toloc, 'VERY-HAZARDOUS')))
+    return pre_states
+
+"""
+;; block-road - blocks off a road
+(:method (block-road ?from ?to)
 	   normal
 	   ((police-unit ?police))
 	   (:unordered (set-up-cones ?from ?to)
 	    (get-to ?police ?from)))
-    """
-    if task == 'BLOCK-ROAD': return pre_states #
-    """
-    ;; unblock-road - unblocks a road
-    (:method (unblock-road ?from ?to)
+"""
+_handlers['BLOCK-ROAD'] = _no_information
+
+"""
+;; unblock-road - unblocks a road
+(:method (unblock-road ?from ?to)
 	   normal
 	   ()
 	   ((take-down-cones ?from ?to)))
-    """
-    if task == 'UNBLOCK-ROAD': return pre_states #
-    """
-    ;; get-electricity provides electricity to a site (if not already there)
-    (:method (get-electricity ?loc)
+"""
+_handlers['UNBLOCK-ROAD'] = _no_information
+
+"""
+;; get-electricity provides electricity to a site (if not already there)
+(:method (get-electricity ?loc)
 	   already-has-electricity ;; do nothing
 	   ((not (no-electricity ?loc)))
 	   ()
-           no-electricity
+       no-electricity
 	   ()
 	   ((generate-temp-electricity ?loc))
 	   )
-    """
-    if task == 'GET-ELECTRICITY': return pre_states #
-    """
-    ;; repair-pipe
-    (:method (repair-pipe ?from ?to) ;; repairs a pipe at location
+"""
+_handlers['GET-ELECTRICITY'] = _no_information
+
+"""
+;; repair-pipe
+(:method (repair-pipe ?from ?to) ;; repairs a pipe at location
 	   normal
 	   ((water-crew ?crew))
 	   ((get-to ?crew ?from)
@@ -338,129 +413,144 @@ def populate_states_from_op(pre_states, op):
 	    (!replace-pipe ?crew ?from ?to)
 	    (close-hole ?from ?to)
 	    (take-down-cones ?from ?to)))
-    """
-    if task == 'REPAIR-PIPE': return pre_states
-    """
-    ;; open-hole
-    (:method (open-hole ?from ?to) ;; opens a hole in the street
+"""
+_handlers['REPAIR-PIPE'] = _no_information
+
+"""
+;; open-hole
+(:method (open-hole ?from ?to) ;; opens a hole in the street
 	   normal
 	   ((backhoe ?backhoe))
 	   ((get-to ?backhoe ?from)
 	    (!dig ?backhoe ?from)))
-    """
-    if task == 'OPEN-HOLE': return pre_states # want toloc but no way to get it
-    """
-    ;; close-hole
-    (:method (close-hole ?from ?to) ;; opens a hole in the street
+"""
+_handlers['OPEN-HOLE'] = _no_information # want toloc but no way to get it
+
+"""
+;; close-hole
+(:method (close-hole ?from ?to) ;; opens a hole in the street
 	   normal
 	   ((backhoe ?backhoe))
 	   ((get-to ?backhoe ?from)
 	    (!fill-in ?backhoe ?from)))
-    """
-    if task == 'CLOSE-HOLE': return pre_states # want toloc but no way to get it
-    """
-    ;; set-up-cones
-    (:method (set-up-cones ?from ?to) ;; sets up orange cones at road
+"""
+_handlers['CLOSE-HOLE'] = _no_information # want toloc but no way to get it
+
+"""
+;; set-up-cones
+(:method (set-up-cones ?from ?to) ;; sets up orange cones at road
 	   normal
 	   ((work-crew ?crew))
 	   ((get-to ?crew ?from) (!place-cones ?crew)))
-    """
-    if task == 'SET-UP-CONES': return pre_states # want toloc but no way to get it
-    """
-    ;; take-down-cones
-    (:method (take-down-cones ?from ?to) ;; takes down cones
+"""
+_handlers['SET-UP-CONES'] = _no_information # want toloc but no way to get it
+
+"""
+;; take-down-cones
+(:method (take-down-cones ?from ?to) ;; takes down cones
 	   normal
 	   ((work-crew ?crew))
 	   ((get-to ?crew ?from) (!pickup-cones ?crew)))
-    """
-    if task == 'TAKE-DOWN-CONES': return pre_states # want toloc but no way to get it
-    """
-    ;; clear-wreck
-    (:method (clear-wreck ?from ?to) ;; gets rid of a wreck in any loc
+"""
+_handlers['TAKE-DOWN-CONES'] = _no_information # want toloc but no way to get it
+
+"""
+;; clear-wreck
+(:method (clear-wreck ?from ?to) ;; gets rid of a wreck in any loc
 	   normal
 	   ((wrecked-vehicle ?from ?to ?veh) (garbage-dump ?dump))
 	   ((tow-to ?veh ?dump)))
-    """
-    if task == 'CLEAR-WRECK':
-        # kludge - can't get ?veh, use None as placeholder (it's never used by causes function)
-        fromloc, toloc = op[1:]
-        pre_states[-1] = (objs, tuple(pre_facts | set((('WRECKED-VEHICLE', fromloc, toloc, None),))))
-        return pre_states
-    """
-    ;; tow-to - tows a vehicle somewhere
-    (:method (tow-to ?veh ?to)
+"""
+@_handles('CLEAR-WRECK')
+def _clear_wreck(pre_states, op, type_facts):
+    objs = pre_states[-1][0]
+    # kludge - can't get ?veh, use None as placeholder (it's never used by causes function)
+    _, fromloc, toloc = op
+    pre_states[-1] = (objs, pre_states[-1][1] | _singleton(('WRECKED-VEHICLE', fromloc, toloc, None)))
+    return pre_states
+
+"""
+;; tow-to - tows a vehicle somewhere
+(:method (tow-to ?veh ?to)
 	   normal
 	   ((tow-truck ?ttruck) (vehicle ?veh) (atloc ?veh ?vehloc))
 	   ((get-to ?ttruck ?vehloc)
 	    (!hook-to-tow-truck ?ttruck ?veh)
 	    (get-to ?ttruck ?to)
 	    (!unhook-from-tow-truck ?ttruck ?veh)))
-    """
-    if task == 'TOW-TO': return pre_states #
-    """
-    ;; clear-tree
-    (:method (clear-tree ?tree) ;; this gets rid of a tree in any loc
+"""
+_handlers['TOW-TO'] = _no_information
+
+"""
+;; clear-tree
+(:method (clear-tree ?tree) ;; this gets rid of a tree in any loc
 	   normal
 	   ((tree-crew ?tcrew) (tree ?tree) 
 	    (atloc ?tree ?treeloc))
 	   ((get-to ?tcrew ?treeloc) (!cut-tree ?tcrew ?tree)
 	    (remove-blockage ?tree)))
-    """
-    if task == 'CLEAR-TREE': return pre_states #
-    """
-    ;; remove-blockage
-    (:method (remove-blockage ?stuff)
+"""
+_handlers['CLEAR-TREE'] = _no_information
+
+"""
+;; remove-blockage
+(:method (remove-blockage ?stuff)
 	   move-to-side-of-street
 	   ((work-crew ?crew) (atloc ?stuff ?loc))
 	   ((get-to ?crew ?loc)
 	    (!carry-blockage-out-of-way ?crew ?stuff)))
-    (:method (remove-blockage ?stuff)
+(:method (remove-blockage ?stuff)
 	   carry-away
 	   ((garbage-dump ?dump))
 	   ((get-to ?stuff ?dump)))
-    """
-    if task == 'REMOVE-BLOCKAGE': return pre_states #
-    """
-    ;; declare-curfew
-    (:method (declare-curfew ?town)
+"""
+_handlers['REMOVE-BLOCKAGE'] = _no_information
+
+"""
+;; declare-curfew
+(:method (declare-curfew ?town)
 	   normal
 	   ()
 	   (:unordered (!call EBS) (!call police-chief)))
-    """
-    if task == 'REMOVE-BLOCKAGE': return pre_states
-    """
-    ;; generate-temp-electricity
-    (:method (generate-temp-electricity ?loc)
+"""
+# no handler: DECLARE-CURFEW falls through to _primitive
+
+"""
+;; generate-temp-electricity
+(:method (generate-temp-electricity ?loc)
 	   with-generator
 	   ((generator ?gen))
 	   ((make-full-fuel ?gen) (get-to ?gen ?loc) (!hook-up ?gen ?loc)
 	    (!turn-on ?gen)))
-    """
-    if task == 'GENERATE-TEMP-ELECTRICITY': return pre_states #
-    """
-    ;; make-full-fuel - makes sure arg1 is full of fuel
-    (:method (make-full-fuel ?gen)
+"""
+_handlers['GENERATE-TEMP-ELECTRICITY'] = _no_information
+
+"""
+;; make-full-fuel - makes sure arg1 is full of fuel
+(:method (make-full-fuel ?gen)
 	   with-gas-can
 	   ((gas-can ?gc) (atloc ?gen ?genloc) (service-station ?ss))
 	   ((get-to ?gc ?ss) (add-fuel ?ss ?gc) (get-to ?gc ?genloc)
 	    (!pour-into ?gc ?gen)))
-    (:method (make-full-fuel ?gen)
+(:method (make-full-fuel ?gen)
 	   at-service-station
 	   ((service-station ?ss))
 	   ((get-to ?gen ?ss) (add-fuel ?ss ?gen)))
-    """
-    if task == 'MAKE-FULL-FUEL': return pre_states #
-    """
-    ;; add-fuel (at service-station)
-    (:method (add-fuel ?ss ?obj)
+"""
+_handlers['MAKE-FULL-FUEL'] = _no_information
+
+"""
+;; add-fuel (at service-station)
+(:method (add-fuel ?ss ?obj)
 	   normal
 	   ()
 	   (:unordered (!pay ?ss) (!pump-gas-into ?ss ?obj)))
-    """
-    if task == 'ADD-FUEL': return pre_states
-    """
-    ;; repair-line
-    (:method (repair-line ?crew ?lineloc)
+"""
+_handlers['ADD-FUEL'] = _no_information
+
+"""
+;; repair-line
+(:method (repair-line ?crew ?lineloc)
 	   with-tree
 	   ((tree ?tree) (atloc ?tree ?lineloc)
 	    (atloc ?crew ?lineloc))
@@ -473,69 +563,76 @@ def populate_states_from_op(pre_states, op):
 	   ((shut-off-power ?crew ?lineloc) 
 	    (!remove-wire ?crew ?lineloc)
 	    (!string-wire ?crew ?lineloc) (turn-on-power ?crew ?lineloc)))
-    """
-    if task == 'REPAIR-LINE': return pre_states #
-    """
-    ;; shut-off-power
-    (:method (shut-off-power ?crew ?loc)
+"""
+_handlers['REPAIR-LINE'] = _no_information
+
+"""
+;; shut-off-power
+(:method (shut-off-power ?crew ?loc)
 	   normal
 	   ((in-town ?loc ?town) (powerco-of ?town ?powerco))
 	   (!call ?powerco))
-    """
-    if task == 'SHUT-OFF-POWER': return pre_states # narrow loc to town through fixed state in causes
-    """
-    ;; turn-on-power
-    (:method (turn-on-power ?crew ?loc)
+"""
+_handlers['SHUT-OFF-POWER'] = _no_information # narrow loc to town through fixed state in causes
+
+"""
+;; turn-on-power
+(:method (turn-on-power ?crew ?loc)
 	   normal
 	   ((in-town ?loc ?town) (powerco-of ?town ?powerco))
 	   (!call ?powerco))
-    """
-    if task == 'TURN-ON-POWER': return pre_states # narrow loc to town through fixed state in causes
-    """
-    ;; shut-off-water
-    (:method (shut-off-water ?from ?to)
+"""
+_handlers['TURN-ON-POWER'] = _no_information # narrow loc to town through fixed state in causes
+
+"""
+;; shut-off-water
+(:method (shut-off-water ?from ?to)
 	   normal
 	   ((in-town ?from ?town) (waterco-of ?town ?waterco))
 	   ((!call ?waterco)))
-    """
-    if task == 'SHUT-OFF-WATER': return pre_states # narrow loc to town through fixed state in causes
-    """
-    ;; turn-on-water
-    (:method (turn-on-water ?from ?to)
+"""
+_handlers['SHUT-OFF-WATER'] = _no_information # narrow loc to town through fixed state in causes
+
+"""
+;; turn-on-water
+(:method (turn-on-water ?from ?to)
 	   normal
 	   ((in-town ?from ?town) (waterco-of ?town ?waterco))
 	   ((!call ?waterco)))
-    """
-    if task == 'TURN-ON-WATER': return pre_states # narrow loc to town through fixed state in causes
-    """
-    ;; emt-treat
-    (:method (emt-treat ?person)
+"""
+_handlers['TURN-ON-WATER'] = _no_information # narrow loc to town through fixed state in causes
+
+"""
+;; emt-treat
+(:method (emt-treat ?person)
 	   emt
 	   ((emt-crew ?emt) (atloc ?person ?personloc))
 	   ((get-to ?emt ?personloc) (!treat ?emt ?person)))
-    """
-    if task == 'EMT-TREAT': return pre_states
-    """
-    ;; stabilize
-    (:method (stabilize ?person)
+"""
+_handlers['EMT-TREAT'] = _no_information
+
+"""
+;; stabilize
+(:method (stabilize ?person)
 	   emt
 	   ()
 	   ((emt-treat ?person)))
-    """
-    if task == 'STABILIZE': return pre_states
-    """
-    ;; get-to
-    (:method (get-to ?obj ?place)
+"""
+_handlers['STABILIZE'] = _no_information
+
+"""
+;; get-to
+(:method (get-to ?obj ?place)
 	   already-there
 	   ((atloc ?obj ?place))
 	   ())
-    (:method (get-to ?person ?place)
+(:method (get-to ?person ?place)
 	   person-drives-themself
 	   ((not (atloc ?person ?place))
 	    (person ?person) (vehicle ?veh) (atloc ?veh ?vehloc)
 	    (atloc ?person ?vehloc))
 	   ((drive-to ?person ?veh ?place)))
-    (:method (get-to ?veh ?place)
+(:method (get-to ?veh ?place)
 	   vehicle-gets-driven
 	   ((not (atloc ?veh ?place))
 	    (person ?person)
@@ -543,7 +640,7 @@ def populate_states_from_op(pre_states, op):
 	    (atloc ?person ?vehloc)
 	    )
 	   ((drive-to ?person ?veh ?place)))
-    (:method (get-to ?obj ?place)
+(:method (get-to ?obj ?place)
 	   as-cargo
 	   ((not (atloc ?obj ?place))
 	   (vehicle ?veh)
@@ -558,18 +655,20 @@ def populate_states_from_op(pre_states, op):
 	   ((get-to ?veh ?objloc) (stabilize ?obj) (get-in ?obj ?veh)
 	    (get-to ?veh ?place) (get-out ?obj ?veh))
 	   )
-    """
-    if task == 'GET-TO': return pre_states # all info in subs except for nop case
-    """
-    (:method (drive-to ?person ?veh ?loc)
+"""
+_handlers['GET-TO'] = _no_information # all info in subs except for nop case
+
+"""
+(:method (drive-to ?person ?veh ?loc)
 	   normal
 	   ((person ?person) (vehicle ?veh) (atloc ?veh ?vehloc)
 	    (atloc ?person ?vehloc) (can-drive ?person ?veh))
 	   ((!navegate-vehicle ?person ?veh ?loc)))
-    """
-    if task == 'DRIVE-TO': return pre_states # all info in subs
-    """
-    (:method (get-in ?obj ?veh)
+"""
+_handlers['DRIVE-TO'] = _no_information # all info in subs
+
+"""
+(:method (get-in ?obj ?veh)
 	   ambulatory-person
 	   ((atloc ?obj ?objloc) (atloc ?veh ?objloc) 
 	    (person ?obj) (not (non-ambulatory ?obj)))
@@ -578,20 +677,19 @@ def populate_states_from_op(pre_states, op):
 	   ((atloc ?obj ?objloc) (atloc ?veh ?objloc)
 	    (person ?person) (can-lift ?person ?obj))
 	   ((get-to ?person ?objloc) (!load ?person ?obj ?veh)))
-    """
-    if task == 'GET-IN': return pre_states # all info in subs
-    """
-    (:method (get-out ?obj ?veh)
+"""
+_handlers['GET-IN'] = _no_information # all info in subs
+
+"""
+(:method (get-out ?obj ?veh)
 	   ambulatory-person
 	   ((person ?obj) (not (non-ambulatory ?obj)))
 	   (!climb-out ?obj ?veh)
 	   unload
 	   ((atloc ?veh ?vehloc) (person ?person) (can-lift ?person ?obj))
 	   ((get-to ?person ?vehloc) (!unload ?person ?obj ?veh)))
-    """
-    if task == 'GET-OUT': return pre_states # all info in subs
-    # remaining operators (all primitive, empty preconds/adds/deletes)
-    return pre_states + pre_states[-1:]
+"""
+_handlers['GET-OUT'] = _no_information # all info in subs
 
 def extract_leaves(tree):
     """
@@ -602,10 +700,16 @@ def extract_leaves(tree):
     Outputs:
         leaves[i]: The i^{th} leaf, also a grounded operator of the form (name, arg1, arg2, ...) 
     """
-    if type(tree[0])==str: # base case, "tree" is a node
-        return (tree,)
-    else: # recursive case, tree is a tree, recurse on subtrees
-        return reduce(lambda x,y: x+y, map(extract_leaves, tree[1:]))
+    # depth-first walk with an explicit stack, subtrees pushed in reverse so leaves come out in order
+    leaves = []
+    stack = [tree]
+    while stack:
+        tree = stack.pop()
+        if type(tree[0])==str: # "tree" is a node
+            leaves.append(tree)
+        else: # tree is a tree, visit subtrees
+            stack.extend(reversed(tree[1:]))
+    return tuple(leaves)
 
 def extract_objects(tree):
     """
@@ -616,14 +720,17 @@ def extract_objects(tree):
     Outputs:
         objs: the set of all distinct objects occurring in the tree
     """
+    # walk the tree with an explicit stack, collecting arguments into a single set
     objs = set()
-    if type(tree[0])==str: # base case, "tree" is a node
-        objs |= set(tree[1:])
-    else: # recursive case
-        objs |= set(tree[0][1:])
-        for sub in tree[1:]:
-            objs |= extract_objects(sub)
-    objs -= set(locs) | set(watercos) | set(powercos) # remove static objects
+    stack = [tree]
+    while stack:
+        tree = stack.pop()
+        if type(tree[0])==str: # "tree" is a node
+            objs.update(tree[1:])
+        else: # tree is a tree, visit root and subtrees
+            objs.update(tree[0][1:])
+            stack.extend(tree[1:])
+    objs -= _static_objects # remove static objects
     return objs
 
 def extract_children(tree):
@@ -636,31 +743,28 @@ def extract_children(tree):
     """
     return tuple(child if type(child[0])==str else child[0] for child in tree[1:])
 
-# def search_tree(tree):
-#     # used to rule out empty-case of get-to
-#     if type(tree[0]) != str:
-#         if tree[0][0]=='GET-TO' and len(tree)==1: return True
-#         return any([search_tree(sub) for sub in tree[1:]])
-#     return False
-
-def populate_tree_states(leading_states, next_tree):
+def populate_tree_states(leading_states, next_tree, type_facts, leaves=None):
     """
     Uses populate_states_from_op on every operator in a plan tree.
     Implementation is recursive; should be called at the top level with:
-        leading_states = [(objs, ())]
+        leading_states = [(objs, frozenset())]
         next_tree = the full plan tree
+        type_facts = {}
     Inputs:
         leading_states: a list of states leading up to next_tree
         next_tree: the next plan tree of operators being applied
+        type_facts: the type facts that hold in a prefix of the states, as in populate_states_from_op
+        leaves: if not None, a list to which the leaves of next_tree are appended in order
     Outputs:
         states: leading states with new facts added, and new states resulting from the next_tree
     """
     if type(next_tree[0])==str: # base case, "tree" is primitive operator
-        states = populate_states_from_op(leading_states, next_tree) # = pre_states + [post_state]
+        states = populate_states_from_op(leading_states, next_tree, type_facts) # = pre_states + [post_state], in place
+        if leaves is not None: leaves.append(next_tree)
     else: # recursive case, process each op in next_tree, starting with root
-        states = populate_states_from_op(leading_states, next_tree[0]) # = pre_states
+        states = populate_states_from_op(leading_states, next_tree[0], type_facts) # = pre_states
         for sub in next_tree[1:]:
-            states = populate_tree_states(states, sub) # = pre_states + post_states
+            states = populate_tree_states(states, sub, type_facts, leaves) # = pre_states + post_states
     return states
 
 def preprocess_plan(plan_tree):
@@ -678,12 +782,32 @@ def preprocess_plan(plan_tree):
     root = plan_tree[0]
     children = extract_children(plan_tree)
     objs = extract_objects(plan_tree)
-    actions = extract_leaves(plan_tree)
-    states = populate_tree_states([(tuple(objs), ())], plan_tree)
-    # recover the action indices covered by each child, so that the correct intermediate states are associated
-    indices = [0]
+    # populate states one child at a time, collecting the actions in the same pass
+    # and recording the action indices covered by each child, so that the correct intermediate states are associated
+    type_facts = {}
+    states = populate_states_from_op([(tuple(objs), frozenset())], root, type_facts)
+    actions, indices = [], [0]
     for subtree in plan_tree[1:]:
-        indices.append(indices[-1] + len(extract_leaves(subtree)))
+        states = populate_tree_states(states, subtree, type_facts, actions)
+        indices.append(len(actions))
+    # facts are carried as frozensets while populating, but the corpus format stores tuples
+    # merge in the type facts held by each state, collected from the last state back to the first
+    by_count = sorted(type_facts.items(), key=lambda item: item[1], reverse=True)
+    held, current, f = [], frozenset(), 0
+    for i in reversed(range(len(states))):
+        added = []
+        while f < len(by_count) and by_count[f][1] > i:
+            added.append(by_count[f][0])
+            f += 1
+        if added: current = current | frozenset(added)
+        held.append(current)
+    held.reverse()
+    # convert each distinct state once, so that equal states in u, v and w share one tuple
+    shared = {}
+    for i in range(len(states)):
+        key = (states[i][1], held[i])
+        if key not in shared: shared[key] = (states[i][0], tuple(states[i][1] | held[i]))
+        states[i] = shared[key]
     # convert to (state, task, args) format
     u = ((states[0], root[0], root[1:]),)
     v = tuple((states[indices[k]], children[k][0], children[k][1:]) for k in range(len(children)))
@@ -695,16 +819,12 @@ if __name__ == "__main__":
     print('Parsing lisp...')
     parse_monroe()
 
-    # preprocess each plan tree
-    print('Preprocessing plan trees...')
+    # preprocess plan trees in parallel and stream them to file in corpus order as they arrive
+    print('Preprocessing plan trees and writing to file...')
     from monroe5000 import corpus
-    corpus = tuple(preprocess_plan(plan_tree) for plan_tree in corpus)
-
-    # Write preprocessed corpus to file
-    print('Writing to file...')
-    corpus_file = open('monroe_corpus.py','w')
-    corpus_file.write('corpus = [')
-    for example in corpus:
-        corpus_file.write('%s,\n'%str(example))
-    corpus_file.write(']\n')
-    corpus_file.close()
+    with multiprocessing.Pool() as pool, open('monroe_corpus.py','w') as corpus_file:
+        corpus_file.write('corpus = [')
+        for example in pool.imap(preprocess_plan, corpus, chunksize=64):
+            corpus_file.write(repr(example))
+            corpus_file.write(',\n')
+        corpus_file.write(']\n')
@@ -1,6 +1,7 @@
 """
 Static facts that are always true in every Monroe problem instance.
 """
+import sys
 
 # All possible locations in the domain
 locs = ("TEXACO1", "STRONG", "PARK-RIDGE", "ROCHESTER-GENERAL", "BRIGHTON-DUMP", "HENRIETTA-DUMP", "MARKETPLACE", "AIRPORT", "BRIGHTON-HIGH", "MENDON-POND", "12-CORNERS", "PITTSFORD-PLAZA", "ROCHESTER", "BRIGHTON", "MENDON", "HAMLIN", "WEBSTER", "IRONDEQUOIT", "HENRIETTA", "GREECE", "PARMA", "CLARKSON", "SWEEDEN", "OGDEN", "GATES", "RIGA", "CHILI", "WHEATLAND", "PITTSFORD", "SCOTTSVILLE", "RUSH", "PERINTON", "FAIRPORT", "PENFIELD", "EAST-ROCHESTER", "CHURCHVILLE", "BROCKPORT", "SPENCERPORT", "HILTON", "HONEOYE-FALLS")
@@ -23,4 +24,16 @@ powercos = {
 sleaders = ('SLEADER1','SLEADER2','SLEADER3')
 gens = ('GEN1','GEN2')
 food = ('FOOD1','FOOD2','FOOD3')
-pcrews = ('PCREW1')
+pcrews = ('PCREW1',)
+dumps = ('BRIGHTON-DUMP','HENRIETTA-DUMP')
+
+# Intern every static name, so that comparisons with interned plan parameters can succeed by identity
+locs = tuple(map(sys.intern, locs))
+poslocs = tuple(map(sys.intern, poslocs))
+watercos = {sys.intern(waterco): tuple(map(sys.intern, watercos[waterco])) for waterco in watercos}
+powercos = {sys.intern(powerco): tuple(map(sys.intern, powercos[powerco])) for powerco in powercos}
+sleaders = tuple(map(sys.intern, sleaders))
+gens = tuple(map(sys.intern, gens))
+food = tuple(map(sys.intern, food))
+pcrews = tuple(map(sys.intern, pcrews))
+dumps = tuple(map(sys.intern, dumps))
@@ -1,6 +1,7 @@
 """
 Helper functions for dealing with logic programming formulations
 """
+import functools
 
 def unify(facts, query):
     """
@@ -9,6 +10,8 @@ def unify(facts, query):
     "Variables" are indicated by None in the query
     Valid substitutions with literals from the facts are returned
     """
+    # a query with no variables is a membership check, with the empty substitution if it holds
+    if None not in query: return {()} if query in facts else set()
     matches = set()
     for fact in facts:
         if not len(fact) == len(query): continue
@@ -16,12 +19,46 @@ def unify(facts, query):
         matches.add(tuple(fact[i] for i in range(len(fact)) if query[i] is None))
     return matches
 
-def single_unify(facts, *queries):
+@functools.lru_cache(maxsize=65536)
+def single_unify(facts, *queries, arity=1):
     """
     Return substitution for which one of the queries has precisely one match.
     Useful when required that there is a single unambiguous substitution.
+    If no query has precisely one match, a tuple of arity Nones is returned instead,
+    so every query should have arity variables.
+    facts should be a tuple or frozenset, since results are memoized on (facts, queries).
     """
     for query in queries:
-        matches = unify(facts, query)
+        matches = indexed_unify(facts, query)
         if len(matches)==1: return matches.pop()
-    return tuple(None for q in query if q is None)
+    return (None,)*arity
+
+@functools.lru_cache(maxsize=1024)
+def index_facts(facts):
+    """
+    Index facts by predicate and arity, and by each argument position and value.
+    facts should be a tuple or frozenset, so that the index is built once and reused by every query on the same facts.
+    Returns a dict mapping each (predicate, arity) and (predicate, arity, position, argument) key to the tuple of facts with that key.
+    """
+    index = {}
+    for fact in facts:
+        head = (fact[0], len(fact))
+        index.setdefault(head, []).append(fact)
+        for i in range(1, len(fact)):
+            index.setdefault(head + (i, fact[i]), []).append(fact)
+    return {key: tuple(bucket) for (key, bucket) in index.items()}
+
+def indexed_unify(facts, query):
+    """
+    Same as unify, but only scans the smallest bucket of facts that share the query's predicate, arity,
+    and one of its non-variable arguments, using index_facts.
+    """
+    if query[0] is None or None not in query: return unify(facts, query)
+    index = index_facts(facts)
+    head = (query[0], len(query))
+    bucket = index.get(head, ())
+    for i in range(1, len(query)):
+        if query[i] is None: continue
+        slot = index.get(head + (i, query[i]), ())
+        if len(slot) < len(bucket): bucket = slot
+    return unify(bucket, query)
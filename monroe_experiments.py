@@ -1,5 +1,12 @@
 #!/usr/bin/env python
 
+import functools
+import gc
+import io
+import logging
+import logging.handlers
+import multiprocessing
+import sys
 import time
 import pickle as pkl
 import numpy as np
@@ -9,6 +16,15 @@ import copct
 import monroe_corpus.monroe_domain as md
 from monroe_corpus.monroe_corpus import corpus
 
+# parsimony criteria compared by run_sample, as labeled in copct.multiCriteriaTLCovers
+_criteria = ("mc", "md", "xd", "fsn", "fsx", "mp")
+
+# experiment progress is buffered and written to stdout in batches, once per sample
+_logger = logging.getLogger("monroe")
+_log_handler = logging.handlers.MemoryHandler(capacity=1024, target=logging.StreamHandler(sys.stdout))
+_logger.addHandler(_log_handler)
+_logger.setLevel(logging.INFO)
+
 def run_sample(M, causes, u_correct, w, verbose=True, timeout=600, timeout_irr=300, max_tlcovs=13000000):
     """
     Run experimental evaluation on one sample plan.
@@ -25,49 +41,76 @@ def run_sample(M, causes, u_correct, w, verbose=True, timeout=600, timeout_irr=3
         result: dictionary with various key:value pairs summarizing the outcomes of the experiment.
     """
 
-    # run copct
-    start = time.clock()
-    status, tlcovs, g = copct.explain(causes, w, M=M, verbose=verbose, timeout=timeout, max_tlcovs=max_tlcovs)
-    runtime = time.clock()-start
-
-    # record execution info
-    result = {}
-    result["runtime"] = runtime
-    result["status"] = status
-    if not status == "Success": return result
-
-    # top-level results
-    result["correct"] = u_correct in [u for (u,_,_,_,_) in tlcovs]
-    result["|tlcovs|"] = len(tlcovs)
-    print("correct=%s, |tlcovs|=%d"%(result["correct"], result["|tlcovs|"]))
-
-    # compare parsimony criteria
-    criteria = [("_mc", copct.minCardinalityTLCovers),
-                ("_md", copct.maxDepthTLCovers),
-                ("_xd", copct.minimaxDepthTLCovers),
-                ("_fsn", copct.minForestSizeTLCovers),
-                ("_fsx", copct.maxForestSizeTLCovers),
-                ("_mp", copct.minParametersTLCovers)]
-    for (label, fun) in criteria:
-        pruned_tlcovs, extremum = fun(tlcovs)
-        correct = u_correct in [u for (u,_,_,_,_) in pruned_tlcovs]
-        count = len(pruned_tlcovs)
-        result["correct%s"%label] = correct
-        result["|tlcovs%s|"%label] = count
-        result["extremum%s"%label] = extremum
-        print("%s: correct=%s, count=%d, extremum=%d"%(label, correct, count, extremum))
-
-    # special handling for irredundancy
-    status, tlcovs_irr = copct.irredundantTLCovers(tlcovs, timeout=timeout_irr)
-    result["irr_success"] = status
-    if not status: return result
-    result["correct_irr"] = u_correct in [u for (u,_,_,_,_) in tlcovs_irr]
-    result["|tlcovs_irr|"] = len(tlcovs_irr)
-    print("correct_irr=%s, count_irr=%d"%(result["correct_irr"], result["|tlcovs_irr|"]))
-
-    return result
-
-def run_experiments(use_original=True, num_samples=None, filename=None, verbose=True, timeout=600, timeout_irr=300, max_tlcovs=13000000):
+    # the domain caches are cleared after each sample, so that memory does not grow over many samples,
+    # and the buffered log is flushed, so that each sample's progress is written together
+    try:
+        # run copct
+        start = time.perf_counter()
+        status, tlcovs, g = copct.explain(causes, w, M=M, verbose=verbose, timeout=timeout, max_tlcovs=max_tlcovs)
+        runtime = time.perf_counter()-start
+
+        # record execution info
+        result = {}
+        result["runtime"] = runtime
+        result["status"] = status
+        if not status == "Success": return result
+
+        # top-level results
+        # scan lazily for the correct cover, stopping at the first match rather than building a list of covers
+        result["correct"] = any(u == u_correct for (u,_,_,_,_) in tlcovs)
+        result["|tlcovs|"] = len(tlcovs)
+        _logger.info("correct=%s, |tlcovs|=%d", result["correct"], result["|tlcovs|"])
+
+        # compare parsimony criteria
+        # each cover's metrics are computed once and shared by the criteria that use them
+        pruned = copct.multiCriteriaTLCovers(tlcovs, criteria=_criteria)
+        for criterion in _criteria:
+            label = "_%s"%criterion
+            pruned_tlcovs, extremum = pruned[criterion]
+            correct = any(u == u_correct for (u,_,_,_,_) in pruned_tlcovs)
+            count = len(pruned_tlcovs)
+            result["correct%s"%label] = correct
+            result["|tlcovs%s|"%label] = count
+            result["extremum%s"%label] = extremum
+            _logger.info("%s: correct=%s, count=%d, extremum=%d", label, correct, count, extremum)
+
+        # special handling for irredundancy
+        status, tlcovs_irr = copct.irredundantTLCovers(tlcovs, timeout=timeout_irr)
+        result["irr_success"] = status
+        if not status: return result
+        result["correct_irr"] = any(u == u_correct for (u,_,_,_,_) in tlcovs_irr)
+        result["|tlcovs_irr|"] = len(tlcovs_irr)
+        _logger.info("correct_irr=%s, count_irr=%d", result["correct_irr"], result["|tlcovs_irr|"])
+
+        return result
+    finally:
+        md.clear_caches()
+        _log_handler.flush()
+
+def run_corpus_sample(sample, use_original=True, **kwargs):
+    """
+    Run experimental evaluation on one sample plan from the corpus.
+    Inputs:
+        sample: index of the sample plan in the corpus
+        use_original: if True, run on the original corpus, otherwise run on the modified
+        kwargs: additional parameters for run_sample
+    Outputs:
+        sample: the same sample index, so that results can be matched up when they arrive out of order
+        result: dictionary of results returned by run_sample
+    """
+    _logger.info("Starting plan # %d in %s corpus...", sample, "original" if use_original else "modified")
+    _log_handler.flush() # so that the plan is identified before explain's own output, or if the sample never finishes
+    u_original, u_modified, plan = corpus[sample]
+    if use_original:
+        u_correct = u_original
+        causes = md.causes
+    else:
+        u_correct = u_modified
+        causes = md.mid_causes
+    w = md.intern_plan(plan)
+    return sample, run_sample(md.M, causes, u_correct, w, **kwargs)
+
+def run_experiments(use_original=True, num_samples=None, filename=None, verbose=True, timeout=600, timeout_irr=300, max_tlcovs=13000000, processes=1):
     """
     Run experiments on many samples in the corpus.
     Inputs:
@@ -76,38 +119,89 @@ def run_experiments(use_original=True, num_samples=None, filename=None, verbose=
         filename: name of file in which to save results.
             Defaults to "monroe_results.pkl" or "monroe_results_modified.pkl" depending on use_original flag.
         verbose, timeout, timeout_irr, max_tlcovs: additional parameters for run_sample
+        processes: number of worker processes running samples in parallel, or None for one per CPU.
+            Defaults to 1, in which case samples are run in this process.
+            Each worker may use as much memory as a sequential run (up to 32GB for the full experiments).
     Outputs:
        results[s]: dictionary or results for s^th sample plan
     """
 
     # Setup
-    samples = np.random.permutation(len(corpus))
-    if num_samples is not None:
-        samples = samples[:num_samples]
+    if num_samples is None:
+        samples = np.random.permutation(len(corpus))
+    else:
+        samples = np.random.choice(len(corpus), size=min(num_samples, len(corpus)), replace=False)
     if filename is None:
         if use_original: filename = "monroe_results.pkl"
         else: filename = "monroe_results_modified.pkl"
 
-    # Run experiments
+    # Run experiments, in parallel worker processes unless there is only one,
+    # appending each sample's result to the results file as it completes
+    run = functools.partial(run_corpus_sample, use_original=use_original, verbose=verbose, timeout=timeout, max_tlcovs=max_tlcovs, timeout_irr=timeout_irr)
     results = {}
-    for s in range(len(samples)):
-        sample = samples[s]
-        print("Starting sample %d of %d (plan # %d in %s corpus)..."%(s, len(samples), sample, "original" if use_original else "modified"))
-        if use_original:
-            u_correct = corpus[sample][0]
-            causes = md.causes
-        else:
-            u_correct = corpus[sample][1]
-            causes = md.mid_causes
-        w = corpus[sample][2]
-        results[sample] = run_sample(md.M, causes, u_correct, w, verbose=verbose, timeout=timeout, max_tlcovs=max_tlcovs, timeout_irr=timeout_irr)
-        results_file = open(filename, "w")
-        pkl.dump(results, results_file)
-        results_file.close()
-        print("%d of %d samples processed..."%(s+1, len(samples)))
+    pool = None if processes == 1 else multiprocessing.Pool(processes)
+    try:
+        with open(filename, "wb") as results_file:
+            outcomes = map(run, samples.tolist()) if pool is None else pool.imap_unordered(run, samples.tolist())
+            for s, (sample, result) in enumerate(outcomes):
+                results[sample] = result
+                pkl.dump((sample, result), results_file, protocol=pkl.HIGHEST_PROTOCOL)
+                results_file.flush()
+                _logger.info("%d of %d samples processed...", s+1, len(samples))
+                _log_handler.flush()
+    finally:
+        if pool is not None: pool.terminate()
+
+    return results
 
+def load_results(filename):
+    """
+    Load the results saved by run_experiments.
+    The file is a sequence of pickled (sample, result) records, one per processed sample.
+    Inputs:
+        filename: name of file where results are saved
+    Outputs:
+        results[s]: dictionary of results for s^th sample plan
+    """
+    results = {}
+    with open(filename, "rb") as f:
+        data = io.BytesIO(f.read())
+    # loading allocates many small dicts, so garbage collection is paused rather than triggered repeatedly
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        while True:
+            try:
+                sample, result = pkl.load(data)
+            except EOFError:
+                break
+            results[sample] = result
+    finally:
+        if gc_enabled: gc.enable()
     return results
 
+def summarize_counts(counts):
+    """
+    Summarize the cover counts found for many samples, as reported in publications.
+    Inputs:
+        counts: sequence of cover counts, one per sample
+    Outputs:
+        n: the number of samples
+        ge100: the number of samples with >= 100 covers
+        eq1: the number of samples with exactly 1 cover
+        k: the index of the ~90th percentile sample
+        p90: the cover count of the ~90th percentile sample
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    k = int(0.9*counts.size)
+    # one histogram of the counts, with every count >= 100 in the last bin, gives all three summaries
+    cumulative = np.cumsum(np.bincount(np.minimum(counts, 100), minlength=101))
+    ge100 = counts.size - cumulative[99]
+    eq1 = cumulative[1] - cumulative[0]
+    if cumulative[99] > k: p90 = np.searchsorted(cumulative, k, side="right")
+    else: p90 = np.partition(counts, k)[k] # the percentile is in the last bin, so select it exactly
+    return counts.size, ge100, eq1, k, p90
+
 def show_results(filename="monroe_results.pkl"):
     """
     Print/plot results shown in publications
@@ -116,32 +210,45 @@ def show_results(filename="monroe_results.pkl"):
     """
 
     # load results
-    f = open(filename, "r")
-    results = pkl.load(f)
-    f.close()
+    results = load_results(filename)
+
+    # tabulate accuracy and specificity for every criterion in one pass over the results
+    accuracy_criteria = ["","_mc","_irr","_md","_xd", "_mp", "_fsn", "_fsx"]
+    count_criteria = ["_mc", "_irr", "_md", "_xd", "_mp"]
+    evaluated = np.zeros((len(results), len(accuracy_criteria)), dtype=bool)
+    correct = np.zeros((len(results), len(accuracy_criteria)), dtype=bool)
+    tlcov_counts = np.full((len(results), len(count_criteria)), -1, dtype=np.int64) # -1 where a count is missing
+    for i, result in enumerate(results.values()):
+        for j, criterion in enumerate(accuracy_criteria):
+            if "correct%s"%criterion in result and result["correct"]:
+                evaluated[i,j] = True
+                correct[i,j] = result["correct%s"%criterion]
+        for j, criterion in enumerate(count_criteria):
+            tlcov_counts[i,j] = result.get("|tlcovs%s|"%criterion, -1)
 
     # accuracy
-    for criterion in ["","_mc","_irr","_md","_xd", "_mp", "_fsn", "_fsx"]:
-        r = {s:results[s] for s in results if "correct%s"%criterion in results[s] and results[s]["correct"]}
-        num_correct = len([s for s in r if r[s]["correct%s"%criterion]])
-        if len(r) > 0:
-            print("%s: %d of %d (%.1f %%)"%(criterion, num_correct, len(r), 100.0*num_correct/len(r)))
+    num_evaluated = evaluated.sum(axis=0)
+    num_correct = correct.sum(axis=0)
+    for j, criterion in enumerate(accuracy_criteria):
+        if num_evaluated[j] > 0:
+            print("%s: %d of %d (%.1f %%)"%(criterion, num_correct[j], num_evaluated[j], 100.0*num_correct[j]/num_evaluated[j]))
 
         else:
-            print("%s: %d of %d"%(criterion, num_correct, len(r)))
+            print("%s: %d of %d"%(criterion, num_correct[j], num_evaluated[j]))
 
     # specificity
     counts = {}
-    for criterion in ["_mc", "_irr", "_md", "_xd", "_mp"]:
-        #counts[criterion] = [results[s]["|tlcovs%s|"%criterion] for s in results if "|tlcovs%s|"%criterion in results[s] and results[s]['correct']]
-        counts[criterion] = [results[s]["|tlcovs%s|"%criterion] for s in results if "|tlcovs%s|"%criterion in results[s]]
+    for j, criterion in enumerate(count_criteria):
+        counts[criterion] = tlcov_counts[tlcov_counts[:,j] >= 0, j]
 
     # count summaries
-    print("%d of %d samples have >= 100 MC covers"%(np.count_nonzero(np.array(counts["_mc"])>=100), len(counts["_mc"])))
-    print("%d of %d samples have 1 MC cover"%(np.count_nonzero(np.array(counts["_mc"])==1), len(counts["_mc"])))
-    print("%d samples (~90 %%) <= %d MC covers"%(int(np.floor(0.9*len(counts["_mc"]))), np.sort(counts["_mc"])[int(np.floor(0.9*len(counts["_mc"])))]))
-    print("%d of %d samples have 1 MP cover"%(np.count_nonzero(np.array(counts["_mp"])==1), len(counts["_mp"])))
-    print("%d samples (~90 %%) <= %d MP covers"%(int(np.floor(0.9*len(counts["_mp"]))), np.sort(counts["_mp"])[int(np.floor(0.9*len(counts["_mp"])))]))
+    n, ge100, eq1, k, p90 = summarize_counts(counts["_mc"])
+    print("%d of %d samples have >= 100 MC covers"%(ge100, n))
+    print("%d of %d samples have 1 MC cover"%(eq1, n))
+    print("%d samples (~90 %%) <= %d MC covers"%(k, p90))
+    n, _, eq1, k, p90 = summarize_counts(counts["_mp"])
+    print("%d of %d samples have 1 MP cover"%(eq1, n))
+    print("%d samples (~90 %%) <= %d MP covers"%(k, p90))
 
     # top-level vs irredundant
     r = {k:results[k] for k in results if '|tlcovs_irr|' in results[k]}
@@ -181,7 +288,9 @@ def show_results(filename="monroe_results.pkl"):
     fig = plt.figure()
     ax = plt.gca()
     fig.subplots_adjust(bottom=0.15)
-    ax.scatter(np.log2([r[k]['|tlcovs|'] for k in r]), np.log2([r[k]['|tlcovs_irr|'] for k in r]))
+    tl = np.fromiter((r[k]['|tlcovs|'] for k in r), dtype=np.int64, count=len(r))
+    irr = np.fromiter((r[k]['|tlcovs_irr|'] for k in r), dtype=np.int64, count=len(r))
+    ax.scatter(np.log2(tl), np.log2(irr))
     plt.xlabel("# of top-level covers")
     plt.ylabel("# of irredundant top-level covers")
     ax.set_xlim([-0.5, 16])
@@ -201,9 +310,7 @@ def show_u_precise(filename="monroe_results.pkl"):
     """
 
     # load results
-    f = open(filename, "r")
-    results = pkl.load(f)
-    f.close()
+    results = load_results(filename)
 
     # specificity
     counts = {}
@@ -211,9 +318,10 @@ def show_u_precise(filename="monroe_results.pkl"):
         counts[criterion] = [results[s]["|tlcovs%s|"%criterion] for s in results if "|tlcovs%s|"%criterion in results[s]]
 
     # count summaries
-    print("%d of %d samples have >= 100 MC covers"%(np.count_nonzero(np.array(counts["_mc"])>=100), len(counts["_mc"])))
-    print("%d of %d samples have 1 MC cover"%(np.count_nonzero(np.array(counts["_mc"])==1), len(counts["_mc"])))
-    print("%d samples (~90 %%) <= %d MC covers"%(int(np.floor(0.9*len(counts["_mc"]))), np.sort(counts["_mc"])[int(np.floor(0.9*len(counts["_mc"])))]))
+    n, ge100, eq1, k, p90 = summarize_counts(counts["_mc"])
+    print("%d of %d samples have >= 100 MC covers"%(ge100, n))
+    print("%d of %d samples have 1 MC cover"%(eq1, n))
+    print("%d samples (~90 %%) <= %d MC covers"%(k, p90))
 
     # histogram
     mpl.rcParams['pdf.fonttype'] = 42
@@ -240,18 +348,19 @@ def show_u_precise(filename="monroe_results.pkl"):
 
 if __name__ == "__main__":
 
-    full_experiments = raw_input("Run full experiments?  May use up to 32GB of RAM and over a week of CPU time. [y/n]")
+    full_experiments = input("Run full experiments?  May use up to 32GB of RAM and over a week of CPU time. [y/n]")
 
     # Run experiments.
     if full_experiments == "y":
         run_experiments() # original
         run_experiments(use_original=False) # modified
     else:
-        run_experiments(num_samples=50, max_tlcovs=1000) # original
-        run_experiments(num_samples=50, max_tlcovs=1000, use_original=False) # modified
+        # capped cover counts keep memory low enough to run one worker per CPU
+        run_experiments(num_samples=50, max_tlcovs=1000, processes=None) # original
+        run_experiments(num_samples=50, max_tlcovs=1000, use_original=False, processes=None) # modified
 
     # Show results
     plt.ion()
     results = show_results() # original
     results_modified = show_results(filename="monroe_results_modified.pkl") # modified
-    raw_input("Enter to close...")
+    input("Enter to close...")
@@ -3,13 +3,17 @@
 import itertools as itr
 import copct
 
-# toy causal relation
+# toy causal relation, as a table from effect sequences to their causes
+_CAUSES = {
+    ('g','m','r'): frozenset(['p']),
+    ('p','p'): frozenset(['t']),
+    ('p','g'): frozenset(['x']),
+    ('r','p'): frozenset(['z']),
+}
+_EMPTY = frozenset()
+
 def causes(v):
-    if v == ('g','m','r'): return set(['p'])
-    if v == ('p','p'): return set(['t'])
-    if v == ('p','g'): return set(['x'])
-    if v == ('r','p'): return set(['z'])
-    return set()
+    return _CAUSES.get(v, _EMPTY)
 
 # maximum effect sequence length (gmr case in causes)
 M = 3
@@ -26,7 +30,7 @@ if __name__ == "__main__":
     print('Observed w:')
     print(w)
     print('Singleton sub-covers:')
-    for jk in itr.combinations(range(7),2):
+    for jk in itr.combinations(range(len(w)+1),2):
         if len(g[jk])>0:
             print("sub-seq from %d to %d covered by: %s"%(jk[0], jk[1], g[jk]))
     print('Top-level covers:')